@@ -0,0 +1,367 @@
+import copy
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from api.paginations import LimitResultsSetPagination
+from foodgram.metrics import record_cache
+from foodgram.routers import read_from_replicas
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+VERSION_KEY = 'api-cache:version:{}'
+RESPONSE_KEY = 'api-cache:entry:{}'
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_version(namespace):
+    """Текущая версия пространства имён: (токен, время изменения)."""
+    cache = get_cache()
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, (uuid.uuid4().hex, time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*namespaces):
+    """Сбрасывает закэшированные ответы указанных пространств имён."""
+    get_cache().set_many({
+        VERSION_KEY.format(namespace): (uuid.uuid4().hex, time.time())
+        for namespace in namespaces
+    }, None)
+
+
+def make_etag(*parts):
+    payload = json.dumps(parts, cls=DjangoJSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.md5(payload.encode()).hexdigest())
+
+
+def user_etag(etag, user_state):
+    """ETag общего ответа, дополненный состоянием пользователя."""
+    if user_state is None:
+        return etag
+    return make_etag(etag, user_state)
+
+
+class CachedResponseMixin:
+    """Кэширует ответы list/retrieve, одинаковые для всех посетителей.
+
+    Ключ строится из версии пространства имён cache_namespace, действия,
+    пути и параметров запроса; версию сбрасывают сигналы из api.signals.
+    Ответы снабжаются ETag и, для анонимных запросов, Last-Modified.
+    Обработчик может передать свои валидаторы в атрибуте ответа
+    cache_validators, иначе ETag считается по данным ответа, а
+    Last-Modified берётся из версии пространства имён.
+    Представления с полями, зависящими от пользователя, переопределяют
+    reset_user_state и apply_user_state: в кэше хранится общая версия,
+    а флаги текущего пользователя накладываются поверх неё.
+    """
+
+    cache_namespace = None
+    cached_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def is_cacheable(self, request):
+        return self.action in self.cached_actions
+
+    def get_response_key(self, request, version):
+        params = sorted(request.query_params.lists())
+        raw_key = json.dumps([
+            version, self.action, request.get_host(), request.path, params
+        ])
+        return RESPONSE_KEY.format(hashlib.md5(raw_key.encode()).hexdigest())
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        token, modified = get_version(self.cache_namespace)
+        cache = get_cache()
+        key = self.get_response_key(request, token)
+        entry = cache.get(key)
+        record_cache(self.cache_namespace, entry is not None)
+        response = user_state = None
+        if entry is None:
+            # Ответ из кэша получат все клиенты до следующего сброса,
+            # поэтому он строится по основной базе, а не по реплике.
+            with read_from_replicas(False):
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if request.user.is_authenticated:
+                user_state = self.read_user_state(response.data)
+            data = self.reset_user_state(copy.deepcopy(response.data))
+            validators = getattr(response, 'cache_validators', None)
+            if validators is None:
+                validators = (make_etag(data), int(modified))
+            entry = (data, *validators)
+            cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+        elif request.user.is_authenticated:
+            user_state = self.get_user_state(request, entry[0])
+
+        return self.finalize_cached_response(
+            request, response, entry, user_state
+        )
+
+    def finalize_cached_response(self, request, response, entry, user_state):
+        """Отвечает 304 по If-None-Match/If-Modified-Since либо отдаёт
+        ответ с наложенным состоянием пользователя и валидаторами."""
+
+        data, etag, last_modified = entry
+        etag = user_etag(etag, user_state)
+        if request.user.is_authenticated:
+            last_modified = None
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+
+        if response is None:
+            if user_state is not None:
+                data = self.apply_user_state(copy.deepcopy(data), user_state)
+            response = Response(data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def reset_user_state(self, data):
+        return data
+
+    def read_user_state(self, data):
+        """Состояние пользователя из только что сформированного ответа."""
+        return None
+
+    def get_user_state(self, request, data):
+        """Состояние пользователя для ответа, взятого из кэша."""
+        return None
+
+    def apply_user_state(self, data, user_state):
+        return data
+
+
+def iter_recipes(data):
+    if isinstance(data, dict) and 'results' in data:
+        return data['results']
+    if isinstance(data, list):
+        return data
+    return [data]
+
+
+class RecipeCacheMixin(CachedResponseMixin):
+    """Кэш рецептов: флаги is_favorited, is_in_shopping_cart
+    и is_subscribed автора хранятся сброшенными и вычисляются
+    для пользователя тремя запросами по id рецептов страницы.
+
+    Порядок ?ordering=popular меняется с каждым добавлением в
+    избранное, а счётчик обновляется без сброса кэша, поэтому такие
+    страницы не кэшируются (ETag для них по-прежнему считается).
+    """
+
+    cache_namespace = 'recipes'
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+    uncached_orderings = ('popular',)
+
+    def is_cacheable(self, request):
+        if request.user.is_authenticated and any(
+            name in request.query_params for name in self.user_filters
+        ):
+            return False
+        if request.query_params.get('ordering') in self.uncached_orderings:
+            return False
+        return super().is_cacheable(request)
+
+    def reset_user_state(self, data):
+        for recipe in iter_recipes(data):
+            recipe['is_favorited'] = False
+            recipe['is_in_shopping_cart'] = False
+            recipe['author']['is_subscribed'] = False
+        return data
+
+    def read_user_state(self, data):
+        recipes = iter_recipes(data)
+        return {
+            'favorited': sorted(
+                recipe['id'] for recipe in recipes if recipe['is_favorited']
+            ),
+            'in_shopping_cart': sorted(
+                recipe['id'] for recipe in recipes
+                if recipe['is_in_shopping_cart']
+            ),
+            'subscribed': sorted({
+                recipe['author']['id'] for recipe in recipes
+                if recipe['author']['is_subscribed']
+            }),
+        }
+
+    def get_user_state(self, request, data):
+        recipes = iter_recipes(data)
+        recipe_ids = [recipe['id'] for recipe in recipes]
+        author_ids = {recipe['author']['id'] for recipe in recipes}
+        user = request.user
+        return {
+            'favorited': sorted(Favorite.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            'in_shopping_cart': sorted(ShoppingCart.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            'subscribed': sorted(Follow.objects.filter(
+                user=user, following_id__in=author_ids
+            ).values_list('following_id', flat=True)),
+        }
+
+    def apply_user_state(self, data, user_state):
+        favorited = set(user_state['favorited'])
+        in_shopping_cart = set(user_state['in_shopping_cart'])
+        subscribed = set(user_state['subscribed'])
+        for recipe in iter_recipes(data):
+            recipe['is_favorited'] = recipe['id'] in favorited
+            recipe['is_in_shopping_cart'] = recipe['id'] in in_shopping_cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscribed
+            )
+        return data
+
+
+class RecipeConditionalMixin:
+    """list и retrieve рецептов с ответом 304 до сериализации.
+
+    Сначала выполняется лёгкий запрос: id, updated_at и флаги текущего
+    пользователя рецептов страницы. По ним и данным пагинации строится
+    ETag. Last-Modified (только для анонимных запросов) отдаётся лишь
+    для одного рецепта и равен его updated_at: список меняется и без
+    изменения рецептов на странице, например при удалении рецепта
+    или смене порядка popular. Если копия клиента актуальна, полные
+    объекты не выбираются и не сериализуются.
+    """
+
+    def get_validator_rows(self, queryset):
+        fields = ['id', 'updated_at', 'author_id']
+        fields.extend(
+            field.lstrip('-')
+            for field in LimitResultsSetPagination.get_ordering(queryset)
+        )
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(author_is_subscribed=Exists(
+                Follow.objects.filter(user=user, following=OuterRef('author'))
+            ))
+            fields.extend(
+                ('is_favorited', 'is_in_shopping_cart', 'author_is_subscribed')
+            )
+        return queryset.prefetch_related(None).values(*dict.fromkeys(fields))
+
+    def get_validators(self, rows, paging=None, detail=False):
+        """Возвращает (ETag, Last-Modified) общей части ответа
+        и состояние пользователя."""
+
+        etag = make_etag(
+            [(row['id'], row['updated_at']) for row in rows], paging
+        )
+        last_modified = None
+        if detail:
+            last_modified = int(rows[0]['updated_at'].timestamp())
+        user_state = None
+        if self.request.user.is_authenticated:
+            user_state = {
+                'favorited': sorted(
+                    row['id'] for row in rows if row['is_favorited']
+                ),
+                'in_shopping_cart': sorted(
+                    row['id'] for row in rows if row['is_in_shopping_cart']
+                ),
+                'subscribed': sorted({
+                    row['author_id'] for row in rows
+                    if row['author_is_subscribed']
+                }),
+            }
+        return (etag, last_modified), user_state
+
+    def get_not_modified(self, request, validators, user_state):
+        etag, last_modified = validators
+        if request.user.is_authenticated:
+            last_modified = None
+        return get_conditional_response(
+            request, etag=user_etag(etag, user_state),
+            last_modified=last_modified
+        )
+
+    def set_validators(self, response, validators, user_state):
+        etag, last_modified = validators
+        response.cache_validators = validators
+        response['ETag'] = user_etag(etag, user_state)
+        if self.request.user.is_authenticated:
+            last_modified = None
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.paginate_queryset(self.get_validator_rows(queryset))
+        paging = None
+        if rows is None:
+            rows = list(self.get_validator_rows(queryset))
+        else:
+            paging = self.get_paginated_response([]).data
+        validators, user_state = self.get_validators(rows, paging)
+        not_modified = self.get_not_modified(request, validators, user_state)
+        if not_modified is not None:
+            return not_modified
+
+        recipes = self.get_queryset().in_bulk([row['id'] for row in rows])
+        serializer = self.get_serializer(
+            [recipes[row['id']] for row in rows if row['id'] in recipes],
+            many=True
+        )
+        if paging is None:
+            response = Response(serializer.data)
+        else:
+            response = self.get_paginated_response(serializer.data)
+        return self.set_validators(response, validators, user_state)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        # Как get_object_or_404 в DRF: нечисловой id - это 404, а не 500.
+        try:
+            rows = list(self.get_validator_rows(
+                self.filter_queryset(self.get_queryset())
+            ).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}))
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not rows:
+            raise Http404
+        validators, user_state = self.get_validators(rows, detail=True)
+        not_modified = self.get_not_modified(request, validators, user_state)
+        if not_modified is not None:
+            return not_modified
+        response = super().retrieve(request, *args, **kwargs)
+        return self.set_validators(response, validators, user_state)
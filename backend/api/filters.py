@@ -2,6 +2,15 @@ from django_filters import rest_framework as filters
 
 from recipes.models import Recipe, Tag
 
+# Значения ?ordering= и соответствующая сортировка. Для каждой есть
+# индекс, а id делает ключ уникальным для пагинации по курсору.
+ORDERINGS = {
+    '-pub_date': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+    'cooking_time': ('cooking_time', 'id'),
+}
+
 
 class RecipeFilter(filters.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
@@ -14,6 +23,11 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(value, value) for value in ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
 
@@ -22,7 +36,9 @@ class RecipeFilter(filters.FilterSet):
             'author',
             'tags',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search',
+            'ordering'
         )
 
     def get_is_favorited(self, queryset, name, value):
@@ -34,3 +50,9 @@ class RecipeFilter(filters.FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset.all()
+
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
@@ -0,0 +1,288 @@
+import io
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.catalogue import ingredient_catalogue
+from recipes.matching import match_index
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+BUDGETS_PATH = os.path.join(settings.BASE_DIR, 'data',
+                            'benchmark_budgets.json')
+METRICS = ('queries', 'time_ms', 'memory_kb')
+# Запас, с которым --update-budgets записывает измеренные значения:
+# время сильно зависит от машины, память - от версий библиотек.
+HEADROOM = {'queries': 1, 'time_ms': 3, 'memory_kb': 1.5}
+PREFIX = 'benchmark'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-default',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-api',
+    },
+}
+
+Scenario = namedtuple('Scenario', 'name requests authenticated cached')
+
+
+def get(path, authenticated=False, cached=False):
+    return (('get', path),), authenticated, cached
+
+
+SCENARIOS = [Scenario(name, *params) for name, params in (
+    ('recipes_list', get('/api/recipes/')),
+    ('recipes_list_auth', get('/api/recipes/', True)),
+    ('recipes_list_cached', get('/api/recipes/', cached=True)),
+    ('recipes_list_cached_auth', get('/api/recipes/', True, True)),
+    ('recipes_list_limit', get('/api/recipes/?limit=20', True)),
+    ('recipes_list_tags', get('/api/recipes/?tags={tag}', True)),
+    ('recipes_list_author', get('/api/recipes/?author={author_id}', True)),
+    ('recipes_list_favorited', get('/api/recipes/?is_favorited=1', True)),
+    ('recipes_list_in_cart',
+     get('/api/recipes/?is_in_shopping_cart=1', True)),
+    ('recipes_list_search', get('/api/recipes/?search=суп', True)),
+    ('recipes_list_popular', get('/api/recipes/?ordering=popular', True)),
+    ('recipes_list_trending',
+     get('/api/recipes/?ordering=trending', True)),
+    ('recipes_list_cursor', get('/api/recipes/?cursor=', True)),
+    ('recipes_feed', get('/api/recipes/feed/', True)),
+    ('recipes_match', get('/api/recipes/match/?{pantry}', True)),
+    ('recipe_detail', get('/api/recipes/{recipe_id}/')),
+    ('recipe_detail_auth', get('/api/recipes/{recipe_id}/', True)),
+    ('subscriptions',
+     get('/api/users/subscriptions/?recipes_limit=3', True)),
+    ('ingredients_search', get('/api/ingredients/?name=сах')),
+    ('tags_list', get('/api/tags/')),
+    ('shopping_cart_pdf',
+     get('/api/recipes/download_shopping_cart/?format=pdf', True)),
+    ('shopping_cart_json',
+     get('/api/recipes/download_shopping_cart/?format=json', True)),
+    ('favorite_toggle', ((
+        ('post', '/api/recipes/{other_recipe_id}/favorite/'),
+        ('delete', '/api/recipes/{other_recipe_id}/favorite/'),
+    ), True, False)),
+    ('shopping_cart_toggle', ((
+        ('post', '/api/recipes/{other_recipe_id}/shopping_cart/'),
+        ('delete', '/api/recipes/{other_recipe_id}/shopping_cart/'),
+    ), True, False)),
+    ('shopping_cart_bulk_toggle', ((
+        ('post', '/api/recipes/shopping_cart/', '{{"ids": {meal_plan}}}'),
+        ('delete', '/api/recipes/shopping_cart/', '{{"ids": {meal_plan}}}'),
+    ), True, False)),
+)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, число SQL-запросов и выделенную память '
+            'для основных запросов API на сгенерированных данных и '
+            'сравнивает их с бюджетами из data/benchmark_budgets.json. '
+            'Данные создаются внутри транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--samples', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', nargs='*', default=(),
+                            help='Запустить только указанные сценарии')
+        parser.add_argument('--budgets', default=BUDGETS_PATH)
+        parser.add_argument('--no-time', action='store_true',
+                            help='Не сравнивать время, только запросы '
+                                 'и память')
+        parser.add_argument('--update-budgets', action='store_true',
+                            help='Записать измеренные значения с запасом '
+                                 'в файл бюджетов')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['only'] or scenario.name in options['only']
+        ]
+        if not scenarios:
+            raise CommandError('Нет сценариев с такими именами')
+
+        # Данные создаются в незафиксированной транзакции основной базы,
+        # реплики их не видят. Картинки-заглушки откат не удаляет,
+        # поэтому они пишутся во временный MEDIA_ROOT.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            CACHES=CACHES, API_CACHE_ALIAS='api', DATABASE_REPLICAS=[],
+            MEDIA_ROOT=media_root
+        ):
+            with transaction.atomic():
+                context = self.seed(options)
+                results = {
+                    scenario.name: self.measure(scenario, context, options)
+                    for scenario in scenarios
+                }
+                transaction.set_rollback(True)
+            ingredient_catalogue.invalidate()
+            match_index.invalidate()
+
+        self.print_results(results)
+        if options['update_budgets']:
+            self.update_budgets(options['budgets'], results)
+            return
+        self.check_budgets(options, results)
+
+    def seed(self, options):
+        output = io.StringIO()
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=output)
+        call_command(
+            'generate_fixtures', '--prefix', PREFIX,
+            '--users', str(options['users']),
+            '--recipes', str(options['recipes']),
+            '--carts-per-user', '10',
+            '--seed', str(options['seed']),
+            stdout=output
+        )
+        call_command('update_trending', '--full', stdout=output)
+        user = User.objects.get(username=f'{PREFIX}-0')
+        other_recipe = Recipe.objects.exclude(favorites__user=user).exclude(
+            shopping_cart__user=user
+        ).order_by('id').first()
+        author = User.objects.filter(
+            username__startswith=f'{PREFIX}-'
+        ).order_by('-recipes_count', 'id').first()
+        self.clients = {False: APIClient(), True: APIClient()}
+        self.clients[True].force_authenticate(user)
+        return {
+            'recipe_id': Recipe.objects.order_by('-pub_date', '-id')[0].id,
+            'other_recipe_id': other_recipe.id,
+            'meal_plan': json.dumps(list(
+                Recipe.objects.exclude(shopping_cart__user=user).order_by(
+                    'id'
+                ).values_list('id', flat=True)[:20]
+            )),
+            'author_id': author.id,
+            'tag': Tag.objects.order_by('id')[0].slug,
+            'pantry': '&'.join(
+                f'ingredients={ingredient_id}'
+                for ingredient_id in IngredientRecipe.objects.values_list(
+                    'ingredient_id', flat=True
+                ).order_by('ingredient_id').distinct()[:5]
+            ),
+        }
+
+    def reset_caches(self, scenario):
+        if scenario.cached:
+            return
+        for alias in CACHES:
+            caches[alias].clear()
+        ingredient_catalogue.warm_up()
+
+    def run_requests(self, scenario, context):
+        client = self.clients[scenario.authenticated]
+        for method, path, *body in scenario.requests:
+            kwargs = {}
+            if body:
+                kwargs = {
+                    'data': json.loads(body[0].format(**context)),
+                    'format': 'json',
+                }
+            response = getattr(client, method)(
+                path.format(**context), **kwargs
+            )
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{scenario.name}: {method.upper()} {path} вернул '
+                    f'{response.status_code}'
+                )
+
+    def measure(self, scenario, context, options):
+        for _ in range(options['warmup']):
+            self.run_requests(scenario, context)
+
+        times, queries = [], 0
+        for _ in range(options['samples']):
+            self.reset_caches(scenario)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self.run_requests(scenario, context)
+                times.append(time.perf_counter() - started)
+            queries = max(queries, len(captured))
+
+        # Память замеряется отдельным прогоном: tracemalloc
+        # замедляет выполнение в несколько раз.
+        self.reset_caches(scenario)
+        tracemalloc.start()
+        try:
+            self.run_requests(scenario, context)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'queries': queries,
+            'time_ms': round(statistics.median(times) * 1000, 2),
+            'memory_kb': round(peak / 1024, 1),
+        }
+
+    def print_results(self, results):
+        width = max(len(name) for name in results)
+        self.stdout.write(
+            f'{"scenario":<{width}} {"queries":>8} {"ms":>9} {"KiB":>9}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<{width}} {result["queries"]:>8} '
+                f'{result["time_ms"]:>9.2f} {result["memory_kb"]:>9.1f}'
+            )
+
+    def load_budgets(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def update_budgets(self, path, results):
+        budgets = self.load_budgets(path)
+        for name, result in results.items():
+            budgets[name] = {
+                metric: math.ceil(result[metric] * HEADROOM[metric])
+                for metric in METRICS
+            }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(budgets, file, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Бюджеты записаны в {path}'))
+
+    def check_budgets(self, options, results):
+        budgets = self.load_budgets(options['budgets'])
+        metrics = [
+            metric for metric in METRICS
+            if not (options['no_time'] and metric == 'time_ms')
+        ]
+        failures = []
+        for name, result in results.items():
+            if name not in budgets:
+                failures.append(f'{name}: нет бюджета')
+                continue
+            failures.extend(
+                f'{name}: {metric} {result[metric]} > {budgets[name][metric]}'
+                for metric in metrics
+                if result[metric] > budgets[name][metric]
+            )
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
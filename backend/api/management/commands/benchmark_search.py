@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+BATCH_SIZE = 10000
+WORDS = (
+    'суп', 'салат', 'пирог', 'паста', 'рагу', 'запеканка', 'каша', 'омлет',
+    'котлеты', 'блины', 'плов', 'борщ', 'гуляш', 'соус', 'десерт', 'торт',
+    'домашний', 'быстрый', 'острый', 'сливочный', 'овощной', 'постный',
+)
+QUERIES = ('борщ', 'паста', 'сливочный соус', 'абрикос', 'запеканк')
+
+
+def naive_search(queryset, query):
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+    ).order_by('-pub_date')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск рецептов через Recipe.objects.search() '
+            'с наивным icontains. Данные создаются внутри транзакции '
+            'и по умолчанию откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true',
+                            help='Не откатывать сгенерированные данные')
+        parser.add_argument('--explain', action='store_true',
+                            help='Вывести план запроса для каждого поиска')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(random.Random(options['seed']), options['recipes'])
+            for query in QUERIES:
+                self.compare(query, options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self, rng, total):
+        self.stdout.write('Генерация данных...')
+        vocabulary = list(WORDS) + list(
+            Ingredient.objects.values_list('name', flat=True)[:500]
+        )
+        author, _ = User.objects.get_or_create(
+            username='benchmark-search',
+            defaults={'email': 'benchmark-search@example.com',
+                      'first_name': 'Benchmark', 'last_name': 'User',
+                      'password': '!'}
+        )
+        Recipe.objects.bulk_create(
+            (Recipe(name=' '.join(rng.sample(vocabulary, 3)),
+                    text=' '.join(rng.choices(vocabulary, k=30)),
+                    cooking_time=rng.randint(1, 120), author=author)
+             for _ in range(total)),
+            batch_size=BATCH_SIZE
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE recipes_recipe')
+        self.stdout.write(f'Рецептов: {total}')
+
+    def compare(self, query, options):
+        queryset = Recipe.objects.all()
+        for title, search in (
+            ('icontains', naive_search),
+            ('search', lambda queryset, query: queryset.search(query)),
+        ):
+            found = search(queryset, query)
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                count = found.count()
+                list(found[:options['limit']])
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{query!r:>18} {title:>9}: {elapsed * 1000:.1f} мс '
+                f'(count + первая страница), найдено {count}'
+            )
+            if options['explain']:
+                # В PostgreSQL редкие запросы должны идти через Bitmap
+                # Index Scan по recipe_name_trgm_idx и recipe_text_trgm_idx,
+                # частые - последовательным чтением таблицы.
+                self.stdout.write(found.explain())
@@ -0,0 +1,146 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from api.services.shopping_cart import get_shopping_cart
+from recipes.models import Ingredient, IngredientRecipe, Recipe, ShoppingCart
+from users.models import User
+
+BATCH_SIZE = 5000
+
+
+def legacy_shopping_cart(user):
+    """Агрегация в том виде, в каком она была в download_shopping_cart."""
+
+    return list(
+        user.shopping_cart.values(
+            'recipe__ingredients__name',
+            'recipe__ingredients__measurement_unit'
+        ).annotate(amount=Sum('recipe__recipe_ingredients__amount'))
+    )
+
+
+def legacy_rows(user):
+    return user.shopping_cart.values(
+        'recipe__ingredients__name',
+        'recipe__recipe_ingredients__amount'
+    ).count()
+
+
+def current_rows(user):
+    return IngredientRecipe.objects.filter(
+        recipe_id__in=ShoppingCart.objects.filter(
+            user=user
+        ).values('recipe_id')
+    ).values('ingredient__name').count()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает прежнюю и текущую агрегацию списка покупок '
+            'на сгенерированных данных. Данные создаются внутри '
+            'транзакции и по умолчанию откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--samples', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--explain', action='store_true')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не откатывать сгенерированные данные')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            users = self.seed(rng, options)
+            self.compare(rng.sample(users, min(options['samples'],
+                                               len(users))), options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self, rng, options):
+        self.stdout.write('Генерация данных...')
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredients) < options['ingredients_per_recipe']:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'benchmark-{i}', measurement_unit='г')
+                for i in range(1000)
+            )
+            ingredients = list(
+                Ingredient.objects.values_list('id', flat=True)
+            )
+
+        User.objects.bulk_create(
+            (User(email=f'benchmark-{i}@example.com',
+                  username=f'benchmark-{i}', first_name='Benchmark',
+                  last_name='User', password='!')
+             for i in range(options['users'])),
+            batch_size=BATCH_SIZE
+        )
+        users = list(User.objects.filter(
+            username__startswith='benchmark-'
+        ).values_list('id', flat=True))
+
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'benchmark-{i}', text='benchmark',
+                    cooking_time=rng.randint(1, 120),
+                    author_id=rng.choice(users))
+             for i in range(options['recipes'])),
+            batch_size=BATCH_SIZE
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True))
+
+        per_recipe = options['ingredients_per_recipe']
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                              amount=rng.randint(1, 500))
+             for recipe in recipes
+             for ingredient in rng.sample(ingredients, per_recipe)),
+            batch_size=BATCH_SIZE
+        )
+
+        per_user = max(1, options['carts'] // len(users))
+        ShoppingCart.objects.bulk_create(
+            (ShoppingCart(user_id=user, recipe_id=recipe)
+             for user in users
+             for recipe in rng.sample(recipes, min(per_user, len(recipes)))),
+            batch_size=BATCH_SIZE
+        )
+        self.stdout.write(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'позиций в корзинах: {len(users) * per_user}'
+        )
+        return users
+
+    def compare(self, user_ids, options):
+        users = list(User.objects.filter(id__in=user_ids))
+        for title, aggregate, rows in (
+            ('legacy', legacy_shopping_cart, legacy_rows),
+            ('current', get_shopping_cart, current_rows),
+        ):
+            started = time.perf_counter()
+            groups = sum(len(aggregate(user)) for user in users)
+            elapsed = (time.perf_counter() - started) / len(users) * 1000
+            joined = sum(rows(user) for user in users)
+            self.stdout.write(
+                f'{title:>8}: {elapsed:.2f} мс на запрос, '
+                f'строк в соединении: {joined}, строк в результате: {groups}'
+            )
+
+        if options['explain']:
+            explain_options = {}
+            if connection.vendor == 'postgresql':
+                explain_options = {'analyze': True, 'buffers': True}
+            queryset = IngredientRecipe.objects.filter(
+                recipe_id__in=ShoppingCart.objects.filter(
+                    user=users[0]
+                ).values('recipe_id')
+            ).values('ingredient__name').annotate(amount=Sum('amount'))
+            self.stdout.write(queryset.explain(**explain_options))
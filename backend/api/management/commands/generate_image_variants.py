@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.services.images import generate_variants
+from recipes.images import get_variant_names
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии изображений рецептов, '
+            'у которых их ещё нет.')
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values_list('image', 'image_variants').distinct()
+        count = 0
+        for name, variants in names.iterator():
+            if variants != get_variant_names(name):
+                generate_variants(name)
+                count += 1
+        self.stdout.write(f'Поставлено в очередь изображений: {count}')
@@ -1,7 +1,236 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+    В остальных СУБД выполняется обычный COUNT(*)."""
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class UncountedPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class UncountedPaginator(Paginator):
+    """Пагинатор без COUNT(*): наличие следующей страницы определяется
+    выборкой одной лишней записи."""
+
+    count = None
+    num_pages = 1
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        has_next = len(object_list) > self.per_page
+        self.num_pages = number + 1 if has_next else number
+        return UncountedPage(
+            object_list[:self.per_page], number, self, has_next
+        )
 
 
 class LimitResultsSetPagination(PageNumberPagination):
+    """Постраничная пагинация с параметрами page и limit.
+
+    ?count=estimate заменяет COUNT(*) оценкой планировщика, ?count=none
+    отключает подсчёт. С параметром ?cursor включается пагинация по
+    ключу сортировки (для ленты рецептов это pub_date и id): пустой
+    cursor возвращает первую страницу, дальше следует ссылке next.
+    """
+
     page_size = 5
     page_size_query_param = 'limit'
     max_page_size = 20
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_paginators = {
+        'exact': Paginator,
+        'estimate': EstimatedCountPaginator,
+        'none': UncountedPaginator,
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor = None
+        if self.cursor_query_param in request.query_params:
+            return self.paginate_by_cursor(queryset, request)
+        self.django_paginator_class = self.count_paginators.get(
+            request.query_params.get(self.count_query_param), Paginator
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('results', data)
+        ]))
+
+    @staticmethod
+    def get_ordering(queryset):
+        """Порядок сортировки queryset, дополненный id, чтобы ключ
+        сортировки был уникальным."""
+
+        ordering = [
+            field for field in (
+                queryset.query.order_by or queryset.model._meta.ordering
+            )
+            if isinstance(field, str)
+        ]
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    def get_position(self, queryset, ordering, request):
+        """Значения ключа сортировки из ?cursor или None."""
+        position = request.query_params.get(self.cursor_query_param)
+        if not position:
+            return None
+        return self.decode_cursor(queryset, ordering, position)
+
+    def paginate_by_cursor(self, queryset, request):
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+        position = self.get_position(queryset, ordering, request)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(ordering, position)
+            )
+
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.cursor = [
+            self.get_value(page[-1], field.lstrip('-'))
+            for field in ordering
+        ] if page else []
+        return page
+
+    @staticmethod
+    def get_value(obj, name):
+        if isinstance(obj, dict):
+            return obj[name]
+        return getattr(obj, name)
+
+    def get_position_filter(self, ordering, values):
+        position_filter = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': values[index]})
+            for previous, value in zip(ordering[:index], values):
+                condition &= Q(**{previous.lstrip('-'): value})
+            position_filter |= condition
+        return position_filter
+
+    def decode_cursor(self, queryset, ordering, position):
+        try:
+            values = json.loads(
+                base64.urlsafe_b64decode(position.encode()).decode()
+            )
+            if len(values) != len(ordering):
+                raise ValueError
+            return [
+                self.to_python(queryset.model, field.lstrip('-'), value)
+                for field, value in zip(ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, name, value):
+        if name == 'pk':
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def encode_cursor(self, values):
+        # str() сохраняет микросекунды в датах, в отличие от
+        # DjangoJSONEncoder, который округляет их до миллисекунд.
+        return base64.urlsafe_b64encode(
+            json.dumps(values, default=str).encode()
+        ).decode()
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.cursor)
+        )
+
+
+class CursorResultsSetPagination(LimitResultsSetPagination):
+    """Пагинация только по курсору, в том числе без параметра cursor."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return self.paginate_by_cursor(queryset, request)
+
+
+class ListResultsSetPagination(LimitResultsSetPagination):
+    """Постраничная пагинация готовой последовательности результатов,
+    без курсора и оценки числа строк."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor = None
+        return PageNumberPagination.paginate_queryset(
+            self, queryset, request, view
+        )
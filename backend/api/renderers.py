@@ -0,0 +1,56 @@
+from rest_framework import renderers
+
+from api.services.shopping_cart import (get_or_render_pdf, render_csv,
+                                        render_pdf_lines, render_text)
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Список ингредиентов передаётся в render_items, а ответы с ошибками
+    выводятся одной строкой в том же формате.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            return self.render_items(data)
+        if isinstance(data, dict):
+            data = data.get('detail', data)
+        return self.render_message(str(data))
+
+    def render_items(self, items):
+        raise NotImplementedError
+
+    def render_message(self, message):
+        return f'{message}\n'
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render_items(self, items):
+        return get_or_render_pdf(items)
+
+    def render_message(self, message):
+        return render_pdf_lines([message])
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_items(self, items):
+        return render_csv(items)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render_items(self, items):
+        return render_text(items)
@@ -0,0 +1,37 @@
+from rest_framework import serializers
+
+from recipes.images import decode_base64_image, image_storage
+
+
+class Base64ImageField(serializers.ImageField):
+    """Изображение, переданное строкой data:image/...;base64,...
+
+    decode_base64_image сама проверяет формат, размер и разрешение
+    по заголовку файла, поэтому полная проверка Pillow из ImageField
+    для таких строк не выполняется.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            return serializers.FileField.to_internal_value(
+                self, decode_base64_image(data)
+            )
+        return super().to_internal_value(data)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения:
+    {"small": {"webp": ..., "jpeg": ...}, ...}. Пока копии не готовы,
+    поле пустое."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = {}
+        for size, names in value.items():
+            variants[size] = {}
+            for extension, name in names.items():
+                url = image_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[size][extension] = url
+        return variants
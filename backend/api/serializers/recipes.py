@@ -1,13 +1,15 @@
-import base64
-
-from django.core.files.base import ContentFile
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.serializers.fields import Base64ImageField, ImageVariantsField
 from api.serializers.users import CustomUserSerializer
+from recipes.catalogue import ingredient_catalogue
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.signals import ingredients_changed
+
+# Верхняя граница PositiveSmallIntegerField в PostgreSQL.
+MAX_AMOUNT = 32767
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -36,7 +38,15 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
 
 
 class IngredientRecipeLightSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    """Ингредиент в рецепте при записи. id проверяет
+    RecipeSerializerWrite.validate_ingredients сразу для всех
+    ингредиентов рецепта."""
+
+    id = serializers.IntegerField(min_value=1)
+    amount = serializers.IntegerField(
+        min_value=1, max_value=MAX_AMOUNT,
+        error_messages={'min_value': 'Мин. количество 1'}
+    )
 
     class Meta:
         model = IngredientRecipe
@@ -49,23 +59,6 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        # Если полученный объект строка, и эта строка
-        # начинается с 'data:image'...
-        if isinstance(data, str) and data.startswith('data:image'):
-            # ...начинаем декодировать изображение из base64.
-            # Сначала нужно разделить строку на части.
-            format, imgstr = data.split(';base64,')
-            # И извлечь расширение файла.
-            ext = format.split('/')[-1]
-            # Затем декодировать сами данные и поместить результат в файл,
-            # которому дать название по шаблону.
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
-        return super().to_internal_value(data)
-
-
 class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
@@ -73,6 +66,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True, read_only=True, source='recipe_ingredients'
     )
     image = Base64ImageField(required=True, allow_null=False)
+    image_variants = ImageVariantsField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
 
@@ -87,11 +81,14 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         ]
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request_user = self.context.get('request').user
         if not request_user.is_authenticated:
             return False
@@ -99,6 +96,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         return Favorite.objects.filter(user=request_user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request_user = self.context.get('request').user
         if not request_user.is_authenticated:
             return False
@@ -109,17 +108,82 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
 
+class RecipeMatchSerializer(RecipeSerializer):
+    """Рецепт в поиске по имеющимся ингредиентам."""
+
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'coverage',
+            'missing_ingredients'
+        ]
+
+
 class RecipeSerializerWrite(serializers.ModelSerializer):
     image = Base64ImageField(required=True, allow_null=False)
     ingredients = IngredientRecipeLightSerializer(
         many=True, read_only=False
     )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
+    )
 
     class Meta:
         model = Recipe
         fields = ['ingredients', 'tags', 'name', 'image',
                   'text', 'cooking_time']
 
+    @staticmethod
+    def get_missing_error(label, missing):
+        return serializers.ValidationError(
+            f'{label} не найдены: '
+            f'{", ".join(str(pk) for pk in sorted(missing))}'
+        )
+
+    def validate_tags(self, value):
+        """Все теги загружаются одним запросом, повторы отбрасываются."""
+
+        tags = Tag.objects.in_bulk(value)
+        missing = set(value) - tags.keys()
+        if missing:
+            raise self.get_missing_error('Теги', missing)
+        return [tags[pk] for pk in dict.fromkeys(value)]
+
+    def validate_ingredients(self, value):
+        """Ингредиенты берутся из каталога в памяти без запросов
+        к базе. Каталог процесса может ещё не знать о только что
+        добавленном ингредиенте, поэтому недостающие id дочитываются
+        одним запросом. Количества повторяющихся ингредиентов
+        складываются, все несуществующие id перечисляются в одной
+        ошибке."""
+
+        amounts = {}
+        for ingredient in value:
+            amounts[ingredient['id']] = (
+                amounts.get(ingredient['id'], 0) + ingredient['amount']
+            )
+        ingredients = ingredient_catalogue.get_many(amounts)
+        missing = amounts.keys() - ingredients.keys()
+        if missing:
+            ingredients.update(Ingredient.objects.in_bulk(missing))
+            missing -= ingredients.keys()
+        if missing:
+            raise self.get_missing_error('Ингредиенты', missing)
+        too_large = [
+            ingredients[pk].name for pk, amount in amounts.items()
+            if amount > MAX_AMOUNT
+        ]
+        if too_large:
+            raise serializers.ValidationError(
+                f'Количество больше {MAX_AMOUNT}: {", ".join(too_large)}'
+            )
+        return [
+            {'id': ingredients[pk], 'amount': amount}
+            for pk, amount in amounts.items()
+        ]
+
     @staticmethod
     def add_ingredients(ingredients_data, recipe):
         """Добавляет ингредиенты."""
@@ -132,6 +196,7 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
             )
             for ingredient in ingredients_data
         ])
+        ingredients_changed.send(sender=Recipe, instance=recipe)
 
     def create(self, validated_data):
         author = self.context.get('request').user
@@ -142,53 +207,88 @@ class RecipeSerializerWrite(serializers.ModelSerializer):
         self.add_ingredients(ingredients_data, recipe)
         return recipe
 
-    def update(self, instance, validated_data):
-        recipe = instance
-        if not validated_data:
-            return instance
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.name)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
-        )
-        instance.tags.clear()
-        instance.ingredients.clear()
-        tags_data = validated_data.get('tags')
-        instance.tags.set(tags_data)
-        ingredients_data = validated_data.get('ingredients')
-        IngredientRecipe.objects.filter(recipe=recipe).delete()
-        self.add_ingredients(ingredients_data, recipe)
-        instance.save()
-        return instance
+    @staticmethod
+    def update_tags(recipe, tags_data):
+        """Добавляет и убирает только изменившиеся теги.
+        Возвращает True, если набор тегов изменился."""
+
+        current = set(recipe.tags.values_list('id', flat=True))
+        wanted = {tag.id for tag in tags_data}
+        if current - wanted:
+            recipe.tags.remove(*(current - wanted))
+        if wanted - current:
+            recipe.tags.add(*(wanted - current))
+        return current != wanted
 
-    def to_representation(self, instance):
-        return RecipeSerializer(instance, context=self.context).data
+    @staticmethod
+    def update_ingredients(recipe, ingredients_data):
+        """Сравнивает ингредиенты рецепта с новыми и удаляет, обновляет
+        и добавляет только отличающиеся строки. Возвращает True, если
+        что-то изменилось."""
 
+        wanted = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        changed, removed = [], []
+        for row in IngredientRecipe.objects.filter(recipe=recipe).only(
+            'id', 'ingredient_id', 'amount'
+        ):
+            amount = wanted.pop(row.ingredient_id, None)
+            if amount is None:
+                removed.append(row.id)
+            elif amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        if wanted:
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                )
+                for ingredient_id, amount in wanted.items()
+            ])
+        if not (removed or changed or wanted):
+            return False
+        ingredients_changed.send(sender=Recipe, instance=recipe)
+        return True
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    class Meta:
-        fields = ('user', 'recipe')
-        model = Favorite
-
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=['user', 'recipe'],
-                message='Only unique favorite is possible'
-            )
+    def update(self, instance, validated_data):
+        """Записывает только изменившиеся поля и связи. updated_at
+        сдвигается при любом изменении, в том числе только тегов или
+        ингредиентов: по нему индекс поиска по ингредиентам находит
+        изменённые рецепты."""
+
+        update_fields = [
+            field for field in ('name', 'text', 'cooking_time')
+            if field in validated_data
+            and validated_data[field] != getattr(instance, field)
         ]
-
-
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        fields = ('user', 'recipe')
-        model = ShoppingCart
-
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=['user', 'recipe'],
-                message='Only unique recipe for purchases is possible'
+        if 'image' in validated_data:
+            update_fields += ['image', 'image_variants']
+        for field in update_fields:
+            if field in validated_data:
+                setattr(instance, field, validated_data[field])
+        relations_changed = False
+        if 'tags' in validated_data:
+            relations_changed |= self.update_tags(
+                instance, validated_data['tags']
             )
-        ]
+        if 'ingredients' in validated_data:
+            relations_changed |= self.update_ingredients(
+                instance, validated_data['ingredients']
+            )
+        if update_fields or relations_changed:
+            instance.save(update_fields=update_fields + ['updated_at'])
+        return instance
+
+    def to_representation(self, instance):
+        """Ответ строится по рецепту из for_user: ингредиенты и флаги
+        загружаются фиксированным числом запросов."""
+        instance = Recipe.objects.for_user(
+            self.context['request'].user
+        ).get(pk=instance.pk)
+        return RecipeSerializer(instance, context=self.context).data
@@ -1,8 +1,9 @@
+from django.conf import settings
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.serializers.fields import ImageVariantsField
 from recipes.models import Recipe
 from users.models import Follow, User
 
@@ -22,6 +23,8 @@ class CustomUserSerializer(UserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request_user = self.context.get('request').user
         if not request_user.is_authenticated:
             return False
@@ -59,33 +62,10 @@ class CustomUserCreateSerializer(UserSerializer):
         return user
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-    class Meta:
-        fields = ('user', 'following')
-        model = Follow
-
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=['user', 'following'],
-                message='Only unique following is possible'
-            )
-        ]
-
-    def validate(self, data):
-        """Проверяем, что пользователь не подписывается на самого себя."""
-        if data['user'] == data['following']:
-            raise serializers.ValidationError(
-                'Подписка на cамого себя не имеет смысла'
-            )
-        return data
-
-
 class SubscriptionShowSerializer(CustomUserSerializer):
     """Сериализатор отображения подписок."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -101,6 +81,9 @@ class SubscriptionShowSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            return RecipeShortSerializer(obj.latest_recipes, many=True).data
+
         recipes_limit = self.context.get('recipes_limit')
 
         if recipes_limit is None:
@@ -118,18 +101,28 @@ class SubscriptionShowSerializer(CustomUserSerializer):
                 obj.recipes.all(), many=True
             ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения рецептов в подписке."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
+
+
+class BulkRelationSerializer(serializers.Serializer):
+    """Список id рецептов или авторов для массовых операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RELATIONS_MAX_IDS
+    )
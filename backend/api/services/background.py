@@ -0,0 +1,66 @@
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    """Возвращает пул процессов, создавая его при первом обращении."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS
+            )
+        return _executor
+
+
+def finish(key, future, callback, errback):
+    """Передаёт результат завершённой задачи в callback, а ошибку
+    логирует и передаёт в errback."""
+    try:
+        result = future.result()
+    except Exception as error:
+        logger.exception('Background task %s failed', key)
+        if errback is not None:
+            errback(error)
+        return
+    if callback is not None:
+        callback(result)
+
+
+def submit(key, func, *args, callback=None, errback=None):
+    """Запускает func(*args) в пуле процессов.
+
+    Повторная постановка задачи с тем же ключом, пока предыдущая
+    не завершилась, игнорируется. callback получает результат и
+    вызывается в текущем процессе. Если BACKGROUND_WORKERS равен 0,
+    задача выполняется синхронно. Ошибки задачи в обоих случаях
+    логируются и передаются в errback.
+    """
+    if not settings.BACKGROUND_WORKERS:
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as error:
+            future.set_exception(error)
+        finish(key, future, callback, errback)
+        return
+
+    with _lock:
+        if key in _pending:
+            return
+        _pending[key] = None
+
+    def done(future):
+        _pending.pop(key, None)
+        finish(key, future, callback, errback)
+
+    get_executor().submit(func, *args).add_done_callback(done)
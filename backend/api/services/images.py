@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from api.cache import invalidate
+from api.services import background
+from recipes.images import (VARIANT_FORMATS, get_variant_names, image_storage,
+                            render_variants)
+from recipes.models import Recipe
+
+
+def store_variants(name, variants):
+    """Записывает готовые копии всем рецептам с этим изображением."""
+
+    Recipe.objects.filter(image=name).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    invalidate('recipes')
+
+
+def store_rendered_variants(name, variants):
+    """store_variants для callback пула процессов. Он выполняется
+    в служебном потоке, где Django сам не закрывает соединения
+    с базой, поэтому это делается до и после запроса."""
+
+    close_old_connections()
+    try:
+        store_variants(name, variants)
+    finally:
+        close_old_connections()
+
+
+def generate_variants(name):
+    """Ставит в очередь пула процессов создание уменьшенных копий.
+
+    Копии, уже созданные для такого же изображения, не пересоздаются.
+    Пока копий нет, image_variants рецепта пуст и клиенты показывают
+    оригинал.
+    """
+
+    variants = get_variant_names(name)
+    targets = [
+        (
+            image_storage.path(variant),
+            settings.RECIPE_IMAGE_VARIANTS[size],
+            VARIANT_FORMATS[extension]
+        )
+        for size, names in variants.items()
+        for extension, variant in names.items()
+        if not image_storage.exists(variant)
+    ]
+    if not targets:
+        store_variants(name, variants)
+        return
+    background.submit(
+        f'image-variants:{name}', render_variants,
+        image_storage.path(name), targets,
+        callback=lambda paths: store_rendered_variants(name, variants)
+    )
+
+
+def generate_variants_on_commit(recipe):
+    if recipe.image and recipe.image_variants != get_variant_names(
+        recipe.image.name
+    ):
+        name = recipe.image.name
+        transaction.on_commit(lambda: generate_variants(name))
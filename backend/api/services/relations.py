@@ -0,0 +1,223 @@
+from django.db import IntegrityError, connections, router, transaction
+
+from recipes import counters, feed
+from recipes.signals import relations_created, relations_deleted
+from users.models import Follow
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+ABSENT = 'absent'
+INVALID = 'invalid'
+
+
+def get_target_model(model, field):
+    return model._meta.get_field(field).related_model
+
+
+def refresh_counters(model, target_ids):
+    """bulk_create и удаление без сигналов не меняют счётчики,
+    поэтому они пересчитываются только для затронутых строк."""
+
+    for counter in counters.COUNTERS:
+        if counter.source is model:
+            counters.reconcile(
+                counter, counter.model.objects.filter(pk__in=target_ids)
+            )
+
+
+def target_exists(model, field, target_id):
+    return get_target_model(model, field).objects.filter(
+        pk=target_id
+    ).exists()
+
+
+def get_connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def supports_returning(connection):
+    """INSERT и DELETE с RETURNING есть в PostgreSQL и в SQLite 3.35+."""
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def insert_returning(connection, row, target_model, target_id):
+    """Вставляет row одним INSERT ... SELECT ... WHERE EXISTS, если
+    объект, на который она ссылается, существует, а такой связи ещё
+    нет. Возвращает True, если строка вставлена."""
+
+    model = type(row)
+    quote = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.local_concrete_fields
+        if not field.primary_key
+    ]
+    values = [
+        field.get_db_prep_save(field.pre_save(row, True), connection)
+        for field in fields
+    ]
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) '
+        f'SELECT {", ".join(["%s"] * len(fields))} '
+        f'WHERE EXISTS (SELECT 1 FROM {quote(target_model._meta.db_table)} '
+        f'WHERE {quote(target_model._meta.pk.column)} = %s) '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {quote(model._meta.pk.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*values, target_id])
+        return cursor.fetchone() is not None
+
+
+def delete_returning(connection, model, user, field, target_ids):
+    """Удаляет связи одним DELETE ... RETURNING и возвращает id
+    объектов, связи с которыми удалены."""
+
+    quote = connection.ops.quote_name
+    user_column = model._meta.get_field('user').column
+    target_column = model._meta.get_field(field).column
+    sql = (
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {quote(user_column)} = %s '
+        f'AND {quote(target_column)} IN '
+        f'({", ".join(["%s"] * len(target_ids))}) '
+        f'RETURNING {quote(target_column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, *target_ids])
+        return [target_id for target_id, in cursor.fetchall()]
+
+
+def insert(model, user, field, target_id):
+    """Связывает пользователя с одним объектом.
+
+    Вставка идёт одним запросом и только если объект существует: на
+    отложенную проверку внешнего ключа полагаться нельзя, внутри
+    внешней транзакции (ATOMIC_REQUESTS, тесты) она сработала бы
+    только при её фиксации. Повторную связь пропускает ON CONFLICT
+    DO NOTHING, и лишний запрос делается, только чтобы отличить
+    её от несуществующего объекта. Без RETURNING в СУБД связь
+    создаётся через ORM, а счётчики и ленты правит post_save.
+    """
+
+    if model is Follow and target_id == user.pk:
+        return INVALID
+    connection = get_connection(model)
+    row = model(user=user, **{f'{field}_id': target_id})
+    with transaction.atomic(using=connection.alias, savepoint=False):
+        if not supports_returning(connection):
+            if not target_exists(model, field, target_id):
+                return NOT_FOUND
+            try:
+                with transaction.atomic(using=connection.alias):
+                    row.save(force_insert=True)
+            except IntegrityError:
+                return EXISTS
+            return CREATED
+        if insert_returning(
+            connection, row, get_target_model(model, field), target_id
+        ):
+            relations_created(model, user.pk, [target_id])
+            return CREATED
+    if not target_exists(model, field, target_id):
+        return NOT_FOUND
+    return EXISTS
+
+
+def delete_links(model, user, field, target_ids):
+    """Удаляет связи пользователя с target_ids и возвращает id объектов,
+    связи с которыми были удалены. Счётчики и ленты правит
+    relations_deleted: после DELETE ... RETURNING явно, а без RETURNING
+    в СУБД - обработчики post_delete при QuerySet.delete()."""
+
+    connection = get_connection(model)
+    with transaction.atomic(using=connection.alias, savepoint=False):
+        if supports_returning(connection):
+            deleted = delete_returning(
+                connection, model, user, field, target_ids
+            )
+            if deleted:
+                relations_deleted(model, user.pk, deleted)
+            return deleted
+        rows = model.objects.filter(
+            user=user, **{f'{field}_id__in': target_ids}
+        )
+        deleted = list(
+            rows.select_for_update().values_list(f'{field}_id', flat=True)
+        )
+        rows.delete()
+        return deleted
+
+
+def delete(model, user, field, target_id):
+    """Удаляет связь пользователя с объектом одним запросом DELETE."""
+
+    if delete_links(model, user, field, [target_id]):
+        return DELETED
+    if not target_exists(model, field, target_id):
+        return NOT_FOUND
+    return ABSENT
+
+
+def add(model, user, field, target_ids):
+    """Связывает пользователя с объектами target_ids (рецептами или
+    авторами) через model. Возвращает словарь {id: статус}.
+
+    Существующие связи и объекты читаются двумя запросами, новые
+    вставляются одним bulk_create(ignore_conflicts=True): строку,
+    вставленную параллельным запросом, база просто пропустит, а
+    счётчики всё равно пересчитываются по фактическим строкам.
+    """
+
+    target_ids = list(dict.fromkeys(target_ids))
+    results = dict.fromkeys(target_ids, NOT_FOUND)
+    with transaction.atomic():
+        found = set(get_target_model(model, field).objects.filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True))
+        existing = set(model.objects.filter(
+            user=user, **{f'{field}_id__in': target_ids}
+        ).values_list(f'{field}_id', flat=True))
+        created = []
+        for target_id in target_ids:
+            if target_id in existing:
+                results[target_id] = EXISTS
+            elif model is Follow and target_id == user.pk:
+                results[target_id] = INVALID
+            elif target_id in found:
+                results[target_id] = CREATED
+                created.append(target_id)
+        if not created:
+            return results
+        model.objects.bulk_create([
+            model(user=user, **{f'{field}_id': target_id})
+            for target_id in created
+        ], ignore_conflicts=True)
+        refresh_counters(model, created)
+        if model is Follow:
+            feed.subscribe(user.pk, created)
+    return results
+
+
+def remove(model, user, field, target_ids):
+    """Удаляет связи пользователя с target_ids одним запросом DELETE.
+    Возвращает словарь {id: статус}: объекты, с которыми пользователь
+    не связан, отмечаются как ABSENT, несуществующие - NOT_FOUND."""
+
+    target_ids = list(dict.fromkeys(target_ids))
+    results = dict.fromkeys(target_ids, NOT_FOUND)
+    with transaction.atomic():
+        found = get_target_model(model, field).objects.filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True)
+        results.update(dict.fromkeys(found, ABSENT))
+        deleted = delete_links(model, user, field, target_ids)
+        results.update(dict.fromkeys(deleted, DELETED))
+    return results
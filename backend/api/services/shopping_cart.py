@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfgen import canvas
+
+from api.services import background
+from foodgram.metrics import PDF_RENDER_TIME, record_cache
+from recipes.models import IngredientRecipe, ShoppingCart
+
+FONT_NAME = 'Arial'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'fonts', 'arial.ttf')
+CACHE_KEY = 'shopping-cart-pdf:{}'
+JOB_KEY = 'shopping-cart-pdf-job:{}'
+# Отметка о задаче живёт дольше SHOPPING_CART_ASYNC_TIMEOUT, чтобы
+# повторный запрос после этого срока сформировал PDF сам.
+JOB_TIMEOUT = 10 * 60
+TITLE = 'Cписок покупок:'
+EMPTY_TITLE = 'Cписок покупок пуст!'
+FIELDS = ('name', 'measurement_unit', 'amount')
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def get_shopping_cart(user, normalize=False):
+    """Возвращает список ингредиентов из корзины пользователя
+    в виде словарей с ключами name, measurement_unit и amount.
+
+    Суммирование идёт одним проходом по IngredientRecipe рецептов
+    из корзины, без соединения с таблицей рецептов. При normalize=True
+    количества приводятся к базовым единицам из UNIT_CONVERSIONS.
+    """
+
+    items = list(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=ShoppingCart.objects.filter(
+                user=user
+            ).values('recipe_id')
+        ).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).annotate(
+            amount=Sum('amount')
+        ).order_by('name', 'measurement_unit')
+    )
+    if normalize:
+        return normalize_units(items)
+    return items
+
+
+def normalize_units(items):
+    """Переводит количества в базовые единицы и объединяет строки
+    с одинаковым названием ингредиента."""
+
+    merged = {}
+    for item in items:
+        unit, factor = UNIT_CONVERSIONS.get(
+            item['measurement_unit'], (item['measurement_unit'], 1)
+        )
+        key = (item['name'], unit)
+        if key not in merged:
+            merged[key] = {'name': item['name'], 'measurement_unit': unit,
+                           'amount': 0}
+        merged[key]['amount'] += item['amount'] * factor
+    return sorted(merged.values(), key=itemgetter('name', 'measurement_unit'))
+
+
+def get_digest(items):
+    """Хэш содержимого корзины, по которому кэшируется готовый PDF."""
+
+    payload = json.dumps(
+        items, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def format_lines(items):
+    """Строки списка покупок в виде '1. Название - 10 г'."""
+
+    return [
+        f'{index}. {item["name"]} - {item["amount"]} '
+        f'{item["measurement_unit"]}'
+        for index, item in enumerate(items, start=1)
+    ]
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт один раз на процесс."""
+
+    pdfmetrics.registerFont(ttfonts.TTFont(FONT_NAME, FONT_PATH))
+
+
+def render_pdf_lines(lines):
+    """Формирует PDF из строк текста и возвращает его содержимое.
+    Первая строка выводится как заголовок."""
+
+    register_font()
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer)
+    page.setFont(FONT_NAME, 14)
+    x_position, y_position = 50, 800
+    title, *lines = lines
+    page.drawString(x_position, y_position, title)
+    y_position -= 20
+    for line in lines:
+        page.drawString(x_position, y_position, line)
+        y_position -= 15
+        if y_position <= 50:
+            page.showPage()
+            page.setFont(FONT_NAME, 14)
+            y_position = 800
+    page.save()
+    return buffer.getvalue()
+
+
+@PDF_RENDER_TIME.time()
+def render_pdf(items):
+    if not items:
+        return render_pdf_lines([EMPTY_TITLE])
+    return render_pdf_lines([TITLE, *format_lines(items)])
+
+
+def render_csv(items):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(items)
+    return buffer.getvalue()
+
+
+def render_text(items):
+    if not items:
+        return f'{EMPTY_TITLE}\n'
+    return '\n'.join([TITLE, *format_lines(items)]) + '\n'
+
+
+def get_cached_pdf(digest):
+    return cache.get(CACHE_KEY.format(digest))
+
+
+def cache_pdf(digest, content):
+    cache.set(
+        CACHE_KEY.format(digest), content,
+        settings.SHOPPING_CART_CACHE_TIMEOUT
+    )
+
+
+def get_or_render_pdf(items):
+    """Возвращает PDF из кэша или формирует его в текущем процессе."""
+
+    digest = get_digest(items)
+    content = get_cached_pdf(digest)
+    record_cache('shopping_cart_pdf', content is not None)
+    if content is None:
+        content = render_pdf(items)
+        cache_pdf(digest, content)
+    return content
+
+
+def render_pdf_in_background(items, digest):
+    """Ставит формирование PDF в очередь пула процессов.
+    Результат попадает в кэш, откуда его заберёт следующий запрос."""
+
+    def done(content):
+        cache_pdf(digest, content)
+        cache.delete(JOB_KEY.format(digest))
+
+    def failed(error):
+        cache.set(JOB_KEY.format(digest), {'failed': True}, JOB_TIMEOUT)
+
+    background.submit(
+        CACHE_KEY.format(digest), render_pdf, items,
+        callback=done, errback=failed
+    )
+
+
+def schedule_pdf(items):
+    """Возвращает True, если PDF формируется в фоне и клиенту нужно
+    повторить запрос позже, и False, если его надо отдать сразу: он
+    уже в кэше, фоновая задача завершилась ошибкой или не уложилась
+    в SHOPPING_CART_ASYNC_TIMEOUT (например, процесс с ней завершился
+    или результат попал в кэш другого процесса). Тогда PDF формирует
+    рендерер в текущем запросе."""
+
+    digest = get_digest(items)
+    job_key = JOB_KEY.format(digest)
+    if cache.add(job_key, {'started': time.time()}, JOB_TIMEOUT):
+        render_pdf_in_background(items, digest)
+    if get_cached_pdf(digest) is not None:
+        return False
+    # Без BACKGROUND_WORKERS задача уже выполнена, и отметки нет.
+    job = cache.get(job_key)
+    return job is not None and not job.get('failed') and (
+        time.time() - job['started'] < settings.SHOPPING_CART_ASYNC_TIMEOUT
+    )
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import invalidate
+from api.services.images import generate_variants_on_commit
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.signals import (ingredients_changed, ingredients_loaded,
+                             recipes_loaded, trending_updated)
+from users.models import User
+
+
+def invalidate_on_commit(*namespaces):
+    transaction.on_commit(lambda: invalidate(*namespaces))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(ingredients_changed, sender=Recipe)
+@receiver(recipes_loaded, sender=Recipe)
+@receiver(trending_updated, sender=Recipe)
+def invalidate_recipes(sender, **kwargs):
+    invalidate_on_commit('recipes')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    invalidate_on_commit('tags', 'recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(ingredients_loaded, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    invalidate_on_commit('ingredients', 'recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(sender, created=False, update_fields=None,
+                       **kwargs):
+    """Имя и почта автора входят в ответы с рецептами. У нового
+    пользователя рецептов ещё нет."""
+    if created:
+        return
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    invalidate_on_commit('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, **kwargs):
+    generate_variants_on_commit(instance)
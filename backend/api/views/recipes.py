@@ -1,58 +1,146 @@
-import io
-
-from django.db.models import Sum
-from django.http import FileResponse, HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
 from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api.cache import (CachedResponseMixin, RecipeCacheMixin,
+                       RecipeConditionalMixin)
 from api.filters import RecipeFilter
-from api.serializers.recipes import (FavoriteSerializer, IngredientSerializer,
-                                     RecipeSerializer, RecipeSerializerWrite,
-                                     ShoppingCartSerializer, TagSerializer)
-from api.serializers.users import RecipeShortSerializer
+from api.paginations import (CursorResultsSetPagination,
+                             ListResultsSetPagination)
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer)
+from api.serializers.recipes import (IngredientSerializer,
+                                     RecipeMatchSerializer, RecipeSerializer,
+                                     RecipeSerializerWrite, TagSerializer)
+from api.serializers.users import (BulkRelationSerializer,
+                                   RecipeShortSerializer)
+from api.services import relations
+from api.services.shopping_cart import get_shopping_cart, schedule_pdf
+from recipes.catalogue import ingredient_catalogue
+from recipes.feed import get_feed
+from recipes.matching import match_index
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 
-FILENAME = 'my_shopping_cart.pdf'
+FILENAME = 'my_shopping_cart'
+FEED_ORDERING = ('-pub_date', '-id')
+TRUE_VALUES = ('1', 'true', 'True')
+FAVORITE_ERRORS = {
+    relations.EXISTS: 'Рецепт уже в избранном',
+    relations.ABSENT: 'Рецепта нет в избранном',
+}
+SHOPPING_CART_ERRORS = {
+    relations.EXISTS: 'Вы уже добавили этот рецепт в корзину',
+    relations.ABSENT: 'Рецепта нет в корзине',
+}
+
+
+def parse_id(value):
+    """id объекта из URL. Нечисловое значение - это 404, как
+    в get_object_or_404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def toggle_relation(request, model, field, target_id, errors):
+    """Добавляет (POST) или удаляет (DELETE) одну связь текущего
+    пользователя одним запросом к базе. Возвращает True, если связь
+    создана, и False, если удалена; иначе отвечает 404 или 400
+    с сообщением из errors."""
+
+    if request.method == 'POST':
+        result = relations.insert(model, request.user, field, target_id)
+    else:
+        result = relations.delete(model, request.user, field, target_id)
+    if result == relations.NOT_FOUND:
+        raise Http404
+    if result not in (relations.CREATED, relations.DELETED):
+        raise serializers.ValidationError(errors[result])
+    return result == relations.CREATED
+
 
+def change_relations(request, model, field):
+    """Массово добавляет (POST) или удаляет (DELETE) связи текущего
+    пользователя с объектами из {"ids": [...]} и возвращает статус
+    по каждому id в порядке запроса."""
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer = BulkRelationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    change = relations.add if request.method == 'POST' else relations.remove
+    results = change(
+        model, request.user, field, serializer.validated_data['ids']
+    )
+    return Response({'results': [
+        {'id': target_id, 'status': result}
+        for target_id, result in results.items()
+    ]})
+
+
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
+    cache_namespace = 'ingredients'
 
-    def get_queryset(self):
-        queryset = self.queryset
-        name = self.request.query_params.get('name')
-        if name is not None:
-            queryset = queryset.filter(name__startswith=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по ?name= обслуживается индексом в памяти,
+        без обращения к базе данных."""
+
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit', ''))
+        except ValueError:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        limit = max(1, min(limit, settings.INGREDIENT_SEARCH_MAX_LIMIT))
+        serializer = self.get_serializer(
+            ingredient_catalogue.search(name, limit), many=True
+        )
+        return Response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
+    cache_namespace = 'tags'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeCacheMixin, RecipeConditionalMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.action in ['list', 'retrieve']:
+            return Recipe.objects.for_user(self.request.user)
+        return Recipe.objects.all()
+
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return RecipeSerializerWrite
         return RecipeSerializer
 
+    def toggle_recipe(self, request, model, errors):
+        recipe_id = parse_id(self.kwargs['pk'])
+        if not toggle_relation(request, model, 'recipe', recipe_id, errors):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = RecipeShortSerializer(
+            Recipe.objects.get(pk=recipe_id), context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -62,26 +150,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Позволяет текущему пользователю добавить/удалить
         рецепт в список избранных"""
 
-        target_recipe = int(kwargs['pk'])
-        recipe = get_object_or_404(Recipe, id=target_recipe)
-        if request.method == 'DELETE':
-            favorite = get_object_or_404(
-                Favorite, user=request.user, recipe=recipe
-            )
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_recipe(request, Favorite, FAVORITE_ERRORS)
 
-        serializer = FavoriteSerializer(
-            data={'user': request.user.id, 'recipe': recipe.id}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        represent_serializer = RecipeShortSerializer(
-            recipe, context={'request': request}
-        )
-        return Response(
-            represent_serializer.data, status=status.HTTP_201_CREATED
-        )
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        """Добавляет/удаляет несколько рецептов в избранном
+        одним запросом."""
+
+        return change_relations(request, Favorite, 'recipe')
 
     @action(
         detail=True,
@@ -92,41 +174,103 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Позволяет текущему пользователю добавить/удалить
         рецепт в список покупок"""
 
-        target_recipe = int(kwargs['pk'])
-        recipe = get_object_or_404(Recipe, id=target_recipe)
-        if request.method == 'POST':
-            if ShoppingCart.objects.filter(
-                    user=request.user, recipe=recipe
-            ).exists():
-                raise serializers.ValidationError(
-                    'Вы уже добавили этот sрецепт в корзину'
-                )
+        return self.toggle_recipe(
+            request, ShoppingCart, SHOPPING_CART_ERRORS
+        )
 
-            serializer = ShoppingCartSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            represent_serializer = RecipeShortSerializer(
-                recipe, context={'request': request}
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        """Добавляет/удаляет несколько рецептов в списке покупок
+        одним запросом, например весь план питания на неделю."""
+
+        return change_relations(request, ShoppingCart, 'recipe')
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(permissions.IsAuthenticated,),
+        pagination_class=CursorResultsSetPagination
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан текущий пользователь,
+        от новых к старым. Страницы переключаются по ссылке next."""
+
+        paginator = self.paginator
+        position = paginator.get_position(
+            Recipe.objects.all(), FEED_ORDERING, request
+        )
+        queryset = get_feed(
+            request.user, paginator.get_page_size(request) + 1, position
+        ).for_user(request.user).order_by(*FEED_ORDERING)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(permissions.AllowAny,),
+        pagination_class=ListResultsSetPagination
+    )
+    def match(self, request):
+        """Рецепты, которые можно приготовить из имеющихся ингредиентов
+        (?ingredients=<id>&ingredients=<id>...). Выше рецепты, в которых
+        больше доля имеющихся ингредиентов."""
+
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.getlist('ingredients')
+            ]
+        except ValueError:
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите id ингредиентов.'}
             )
-            return Response(
-                represent_serializer.data, status=status.HTTP_201_CREATED
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите хотя бы один ингредиент.'}
             )
-        delete_obj = get_object_or_404(
-            ShoppingCart, user=request.user, recipe=recipe
+        page = self.paginate_queryset(match_index.search(ingredient_ids))
+        recipes = Recipe.objects.for_user(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        results = []
+        for recipe_id, matched, total in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(matched / total, 4)
+            recipe.missing_ingredients = total - matched
+            results.append(recipe)
+        serializer = RecipeMatchSerializer(
+            results, many=True, context=self.get_serializer_context()
         )
-        delete_obj.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListPDFRenderer,
+            JSONRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListTextRenderer
+        )
     )
     def download_shopping_cart(self, request):
         """Позволяет текущему пользователю получить
-        список ингредиентов для покупки"""
+        список ингредиентов для покупки.
+
+        Формат выбирается параметром ?format=pdf|json|csv|txt
+        или заголовком Accept, по умолчанию PDF. С ?normalize=true
+        количества приводятся к базовым единицам (кг -> г, л -> мл)."""
 
         if not request.user.is_authenticated:
             return Response(
@@ -134,46 +278,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        arial = ttfonts.TTFont('Arial', 'fonts/arial.ttf')
-        pdfmetrics.registerFont(arial)
-
-        x_position, y_position = 50, 800
-
-        user_shopping_cart = request.user.shopping_cart.values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(amount=Sum('recipe__recipe_ingredients__amount'))
-        page.setFont('Arial', 14)
-
-        if user_shopping_cart:
-            indent = 20
-            page.drawString(x_position, y_position, 'Cписок покупок:')
-            for index, ingredient in enumerate(user_shopping_cart, start=1):
-                string = (f'{index}. '
-                          f'{ingredient["recipe__ingredients__name"]} -')
-                string += f'{ingredient["amount"]} '
-                string += (
-                    f'{ingredient["recipe__ingredients__measurement_unit"]}'
+        normalize = request.query_params.get('normalize') in TRUE_VALUES
+        items = get_shopping_cart(request.user, normalize=normalize)
+        file_format = request.accepted_renderer.format
+        if (
+            file_format == 'pdf'
+            and 'respond-async' in request.headers.get('Prefer', '')
+            and len(items) >= settings.SHOPPING_CART_ASYNC_THRESHOLD
+        ):
+            if schedule_pdf(items):
+                return JsonResponse(
+                    {'detail': 'Список покупок формируется, '
+                               'повторите запрос позже'},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Retry-After': '1'}
                 )
-                page.drawString(
-                    x_position, y_position - indent,
-                    string)
-                y_position -= 15
-                if y_position <= 50:
-                    page.showPage()
-                    y_position = 800
-            page.save()
-            buffer.seek(0)
-            return FileResponse(
-                buffer, as_attachment=True, filename=FILENAME)
-        page.setFont('Arial', 14)
-        page.drawString(
-            x_position,
-            y_position,
-            'Cписок покупок пуст!')
-        page.save()
-        buffer.seek(0)
-
-        return HttpResponse(buffer, content_type='application/pdf')
+
+        response = Response(items)
+        if items:
+            response['Content-Disposition'] = (
+                f'attachment; filename="{FILENAME}.{file_format}"'
+            )
+        return response
@@ -1,15 +1,24 @@
 import djoser.views
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch, Value, prefetch_related_objects
 from djoser.conf import settings
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from api.serializers.users import (CustomUserCreateSerializer,
-                                   CustomUserSerializer, SubscribeSerializer,
+                                   CustomUserSerializer,
                                    SubscriptionShowSerializer)
+from api.services import relations
+from api.views.recipes import change_relations, parse_id, toggle_relation
+from recipes.models import Recipe
 from users.models import Follow, User
 
+SUBSCRIBE_ERRORS = {
+    relations.EXISTS: 'Вы уже подписаны на этого автора',
+    relations.ABSENT: 'Вы не подписаны на этого автора',
+    relations.INVALID: 'Подписка на cамого себя не имеет смысла',
+}
+
 
 class UserViewSet(djoser.views.UserViewSet):
 
@@ -30,27 +39,31 @@ class UserViewSet(djoser.views.UserViewSet):
         """Позволяет текущему пользователю подписываться/отписываться от
         от автора контента, чей профиль он просматривает."""
 
-        target_user = int(kwargs['id'])
-        author = get_object_or_404(User, id=target_user)
-        if request.method == 'DELETE':
-            subscription = get_object_or_404(
-                Follow, user=request.user, following=author
-            )
-            subscription.delete()
+        author_id = parse_id(kwargs['id'])
+        if not toggle_relation(
+            request, Follow, 'following', author_id, SUBSCRIBE_ERRORS
+        ):
             return Response(status=status.HTTP_204_NO_CONTENT)
-
-        serializer = SubscribeSerializer(
-            data={'user': request.user.id, 'following': author.id}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
         author_serializer = SubscriptionShowSerializer(
-            author, context={'request': request}
+            User.objects.get(pk=author_id), context={'request': request}
         )
         return Response(
             author_serializer.data, status=status.HTTP_201_CREATED
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe-bulk'
+    )
+    def subscribe_bulk(self, request):
+        """Подписывает/отписывает текущего пользователя от нескольких
+        авторов одним запросом."""
+
+        return change_relations(request, Follow, 'following')
+
     @action(
         detail=False,
         methods=['get'],
@@ -60,18 +73,42 @@ class UserViewSet(djoser.views.UserViewSet):
         """Позволяет текущему пользователю
         просмотреть свои подписки."""
 
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True)
+        ).order_by(*User._meta.ordering)
 
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
+        if page is None:
+            page = list(queryset)
+        self.prefetch_latest_recipes(page)
+        serializer = self.get_serializer(page, many=True)
+        if self.paginator is not None:
             return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
         return Response(
             serializer.data, status=status.HTTP_200_OK
         )
 
+    def prefetch_latest_recipes(self, authors):
+        """Загружает рецепты всех авторов страницы одним запросом,
+        с учётом параметра recipes_limit."""
+
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id'
+        )
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            recipes_limit = None
+        if recipes_limit is not None:
+            recipes = recipes.latest_per_author(authors, recipes_limit)
+        prefetch_related_objects(
+            authors,
+            Prefetch('recipes', queryset=recipes, to_attr='latest_recipes')
+        )
+
     def get_serializer_class(self):
         if self.action in ['subscribe', 'subscriptions']:
             return SubscriptionShowSerializer
@@ -0,0 +1,68 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf'))
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'Число SQL-запросов на один запрос к API',
+    ('view',),
+    buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Суммарное время SQL-запросов на один запрос к API',
+    ('view',),
+)
+PDF_RENDER_TIME = Histogram(
+    'foodgram_shopping_cart_pdf_render_seconds',
+    'Время формирования PDF со списком покупок',
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшу ответов и PDF',
+    ('cache', 'result'),
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def get_registry():
+    """В режиме multiprocess (gunicorn с несколькими воркерами) метрики
+    собираются из файлов всех процессов в PROMETHEUS_MULTIPROC_DIR."""
+
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """Отдаёт метрики только с заголовком Authorization: Bearer
+    METRICS_TOKEN. Без METRICS_TOKEN или METRICS_ENABLED метрики
+    недоступны."""
+
+    token = settings.METRICS_TOKEN
+    if not settings.METRICS_ENABLED or not token:
+        raise Http404
+    if not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
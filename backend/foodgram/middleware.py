@@ -0,0 +1,302 @@
+import contextvars
+import cProfile
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+from foodgram.metrics import (REQUEST_DB_TIME, REQUEST_LATENCY,
+                              REQUEST_QUERIES)
+from foodgram.routers import read_from_replicas
+
+logger = logging.getLogger('foodgram.profiling')
+
+_current = contextvars.ContextVar('profiling_state', default=None)
+WHITESPACE = re.compile(r'\s+')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+API_PREFIX = '/api/'
+PRIMARY_KEY = 'read-primary:{}'
+
+
+def get_view_name(request):
+    """Имя обработчика запроса: для ViewSet - «Класс.действие»,
+    для остальных представлений - имя маршрута."""
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'cls', None)
+    actions = getattr(match.func, 'actions', None)
+    if view_class is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{view_class.__name__}.{action}'
+    if view_class is not None:
+        return view_class.__name__
+    return match.view_name or match.func.__name__
+
+
+def fingerprint(sql):
+    """Отпечаток запроса: SQL без параметров. Одинаковые отпечатки
+    внутри одного запроса к API обычно означают N+1."""
+    return hashlib.md5(WHITESPACE.sub(' ', sql).encode()).hexdigest()[:12]
+
+
+class QueryCounter:
+    """Обёртка для connection.execute_wrapper: считает запросы
+    и их суммарное время."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.record(sql)
+
+    def record(self, sql):
+        pass
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Подключает wrapper ко всем соединениям с базами данных."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield wrapper
+
+
+class RequestStats(QueryCounter):
+
+    def __init__(self):
+        super().__init__()
+        self.fingerprints = Counter()
+        self.samples = {}
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def record(self, sql):
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        self.samples.setdefault(key, sql[:200])
+
+    def duplicates(self, threshold):
+        return {
+            self.samples[key]: count
+            for key, count in self.fingerprints.most_common()
+            if count >= threshold
+        }
+
+
+def patch_serializer_data():
+    """Оборачивает BaseSerializer.data, чтобы учитывать время
+    сериализации. Вложенные вызовы .data считаются один раз."""
+
+    original = serializers.BaseSerializer.data
+    if getattr(original.fget, 'profiled', False):
+        return
+
+    def data(self):
+        stats = _current.get()
+        if stats is None:
+            return original.fget(self)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - started
+
+    data.profiled = True
+    serializers.BaseSerializer.data = property(data)
+
+
+class MetricsMiddleware:
+    """Метрики Prometheus по каждому запросу: время ответа, число
+    и время SQL-запросов с разбивкой по View.action. Отключается
+    настройкой METRICS_ENABLED."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with wrap_queries(QueryCounter()) as counter:
+            response = self.get_response(request)
+        view = get_view_name(request)
+        REQUEST_LATENCY.labels(
+            view=view, method=request.method, status=response.status_code
+        ).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(view=view).observe(counter.queries)
+        REQUEST_DB_TIME.labels(view=view).observe(counter.sql_time)
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирование запросов, включается настройкой PROFILING_ENABLED.
+
+    Для каждого запроса считает число SQL-запросов, их суммарное время,
+    повторяющиеся запросы и время сериализации, добавляет заголовок
+    Server-Timing и пишет строку JSON в лог foodgram.profiling. Запросы,
+    превысившие пороги PROFILING_MAX_*, логируются с уровнем WARNING.
+    Доля PROFILING_SAMPLE_RATE запросов выполняется под профилировщиком
+    (cProfile или pyinstrument), результат сохраняется в PROFILING_DIR.
+    Выключенная настройка убирает middleware из цепочки при запуске.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        if settings.PROFILING_PROFILER not in ('cprofile', 'pyinstrument'):
+            raise ImproperlyConfigured(
+                'PROFILING_PROFILER must be cprofile or pyinstrument'
+            )
+        self.get_response = get_response
+        patch_serializer_data()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        try:
+            with wrap_queries(stats):
+                response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            _current.reset(token)
+        profile_path = self.stop_profiler(profiler, request)
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} '
+            f'queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        self.log(request, response, stats, duration, profile_path)
+        return response
+
+    def start_profiler(self):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return None
+        if settings.PROFILING_PROFILER == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, request):
+        if profiler is None:
+            return None
+        name = re.sub(r'[^\w-]+', '_', request.path).strip('_') or 'root'
+        path = os.path.join(
+            settings.PROFILING_DIR, f'{time.time():.6f}-{name}'
+        )
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path += '.prof'
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path += '.html'
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(profiler.output_html())
+        return path
+
+    def get_flags(self, stats, duration, duplicates):
+        flags = []
+        if stats.queries > settings.PROFILING_MAX_QUERIES:
+            flags.append('queries')
+        if duration * 1000 > settings.PROFILING_MAX_DURATION_MS:
+            flags.append('duration')
+        if duplicates:
+            flags.append('duplicates')
+        return flags
+
+    def log(self, request, response, stats, duration, profile_path):
+        duplicates = stats.duplicates(settings.PROFILING_MAX_DUPLICATES)
+        flags = self.get_flags(stats, duration, duplicates)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': get_view_name(request),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_time * 1000, 1),
+            'serializer_ms': round(stats.serializer_time * 1000, 1),
+            'duplicates': duplicates,
+            'flags': flags,
+        }
+        if profile_path is not None:
+            record['profile'] = profile_path
+        logger.log(
+            logging.WARNING if flags else logging.INFO,
+            json.dumps(record, ensure_ascii=False)
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет чтение в GET, HEAD и OPTIONS запросах к API
+    на реплики из DATABASE_REPLICAS, без реплик не подключается.
+
+    После успешного изменяющего запроса клиент ещё
+    READ_YOUR_WRITES_SECONDS секунд читает с основной базы, чтобы
+    сразу видеть свои изменения. Клиент определяется по заголовку
+    Authorization или cookie сессии, отметка хранится в общем кэше,
+    поэтому при нескольких процессах кэш не должен быть локальным.
+    Общие для всех клиентов данные (кэш ответов API, индексы
+    ингредиентов) заполняются только из основной базы.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @staticmethod
+    def get_primary_key(request):
+        credentials = request.headers.get('Authorization') or (
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credentials:
+            return None
+        digest = hashlib.sha256(credentials.encode()).hexdigest()
+        return PRIMARY_KEY.format(digest)
+
+    def __call__(self, request):
+        key = self.get_primary_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if key is not None and response.status_code < 400:
+                cache.set(key, True, settings.READ_YOUR_WRITES_SECONDS)
+            return response
+        use_replicas = request.path.startswith(API_PREFIX) and (
+            key is None or not cache.get(key)
+        )
+        with read_from_replicas(use_replicas):
+            return self.get_response(request)
@@ -0,0 +1,44 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_use_replicas = contextvars.ContextVar('use_replicas', default=False)
+# Токен или сессия только что вошедшего пользователя могли ещё
+# не дойти до реплики, поэтому эти приложения читаются с основной базы.
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+
+@contextmanager
+def read_from_replicas(enabled=True):
+    """Разрешает чтение с реплик внутри блока. Вне таких блоков
+    (команды, фоновые задачи, изменяющие запросы) все запросы идут
+    в основную базу."""
+    token = _use_replicas.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение - со случайной реплики из DATABASE_REPLICAS, если оно
+    разрешено read_from_replicas, запись и миграции - в default."""
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.DATABASE_REPLICAS and _use_replicas.get()
+            and model._meta.app_label not in PRIMARY_APPS
+        ):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
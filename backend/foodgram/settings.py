@@ -1,3 +1,4 @@
+import itertools
 import os
 
 from dotenv import load_dotenv
@@ -21,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -32,6 +34,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.MetricsMiddleware',
+    'foodgram.middleware.ProfilingMiddleware',
+    'foodgram.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -97,6 +102,56 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения, через запятую: DB_REPLICA_HOSTS - серверы,
+# DB_REPLICA_NAMES - базы (несколько баз на одном сервере или файлы
+# SQLite). Недостающие значения берутся из основной базы.
+for number, (host, name) in enumerate(itertools.zip_longest(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')),
+    filter(None, os.getenv('DB_REPLICA_NAMES', default='').split(','))
+), start=1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+
+# Сколько секунд после изменяющего запроса клиент читает с основной
+# базы, чтобы видеть свои изменения несмотря на отставание реплик.
+READ_YOUR_WRITES_SECONDS = int(
+    os.getenv('READ_YOUR_WRITES_SECONDS', default=5)
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Индексы в памяти процессов узнают о сбросе из общего кэша. Кэш
+# LocMemCache у каждого процесса свой, и сброс виден только вызвавшему
+# его процессу, поэтому с ним индексы перестраиваются не реже раза
+# в LOCAL_INDEX_TTL секунд.
+SHARED_CACHE = (
+    CACHES['default']['BACKEND']
+    != 'django.core.cache.backends.locmem.LocMemCache'
+)
+LOCAL_INDEX_TTL = None if SHARED_CACHE else 5 * 60
+
+API_CACHE_ALIAS = 'default'
+
+# Закэшированные ответы API сбрасываются сменой версии в том же кэше.
+# С LocMemCache сброс из одного воркера или из команды manage.py
+# не доходит до остальных, поэтому ответы там живут всего минуту.
+API_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else 60
+
 
 AUTH_USER_MODEL = 'users.User'
 
@@ -140,3 +195,68 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', default=2))
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+
+SHOPPING_CART_ASYNC_THRESHOLD = int(
+    os.getenv('SHOPPING_CART_ASYNC_THRESHOLD', default=100)
+)
+
+# Через сколько секунд после постановки фоновой задачи PDF формируется
+# в самом запросе, если задача так и не положила его в кэш.
+SHOPPING_CART_ASYNC_TIMEOUT = 30
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+# Период полураспада оценки для сортировки ?ordering=trending.
+TRENDING_HALF_LIFE_HOURS = 24
+
+# Удалённые из избранного и корзин рецепты теряют вклад в оценку
+# только при полном пересчёте, он выполняется не реже этого интервала.
+TRENDING_FULL_INTERVAL_HOURS = 1
+
+# Рецепты авторов с большим числом подписчиков не записываются
+# в ленты при публикации, а выбираются при чтении ленты.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+
+# Сколько id принимают массовые операции с избранным, корзиной
+# и подписками.
+BULK_RELATIONS_MAX_IDS = 100
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='') in (
+    '1', 'true', 'True'
+)
+
+# Без токена /api/metrics отвечает 404.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', default='') in (
+    '1', 'true', 'True'
+)
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+
+PROFILING_PROFILER = os.getenv('PROFILING_PROFILER', default='cprofile')
+
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles')
+)
+
+PROFILING_MAX_QUERIES = 20
+
+PROFILING_MAX_DURATION_MS = 500
+
+PROFILING_MAX_DUPLICATES = 5
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_DIMENSION = 4096
+
+RECIPE_IMAGE_VARIANTS = {
+    'small': 480,
+    'large': 1200,
+}
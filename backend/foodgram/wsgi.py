@@ -1,7 +1,17 @@
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+try:
+    from recipes.catalogue import ingredient_catalogue
+    ingredient_catalogue.warm_up()
+except DatabaseError:
+    logging.getLogger(__name__).warning(
+        'Ingredient catalogue was not built at startup'
+    )
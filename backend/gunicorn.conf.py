@@ -0,0 +1,21 @@
+import os
+import shutil
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', default=3))
+
+# Метрики воркеров складываются в общий каталог и собираются
+# при запросе /api/metrics. Переменная должна быть задана до импорта
+# prometheus_client, каталог очищается при старте мастера.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram-metrics')
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
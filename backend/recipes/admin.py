@@ -26,8 +26,10 @@ class RecipesAdmin(admin.ModelAdmin):
         'id',
         'name',
         'author',
-        'pub_date'
+        'pub_date',
+        'favorites_count',
     )
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 @admin.register(Favorite)
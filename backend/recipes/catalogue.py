@@ -0,0 +1,112 @@
+import bisect
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.routers import read_from_replicas
+from recipes.models import Ingredient
+
+VERSION_KEY = 'ingredient-catalogue-version'
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: нижний регистр, ё -> е."""
+    return value.strip().lower().replace('ё', 'е')
+
+
+class IngredientCatalogue:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ингредиенты хранятся отсортированными по нормализованному названию,
+    поэтому поиск по префиксу сводится к двум вызовам bisect, и в словаре
+    по id для проверки ингредиентов рецепта без запросов к базе. Индекс
+    строится при первом обращении и перестраивается, когда меняется
+    версия в общем кэше: её сбрасывает invalidate() при сохранении или
+    удалении ингредиента в любом из процессов. Если кэш не общий,
+    индекс дополнительно устаревает через LOCAL_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = None
+        self._built_at = 0
+
+    def _is_stale(self, version):
+        ttl = settings.LOCAL_INDEX_TTL
+        return self._index is None or version != self._version or (
+            ttl is not None and time.monotonic() - self._built_at >= ttl
+        )
+
+    def _build(self):
+        # Индекс живёт до следующего сброса версии, и отстающая реплика
+        # закрепила бы в нём устаревшие данные.
+        with read_from_replicas(False):
+            ingredients = sorted(
+                Ingredient.objects.all(),
+                key=lambda ingredient: (
+                    normalize(ingredient.name), ingredient.id
+                )
+            )
+        keys = [normalize(ingredient.name) for ingredient in ingredients]
+        by_id = {ingredient.id: ingredient for ingredient in ingredients}
+        return keys, ingredients, by_id
+
+    def _get_index(self):
+        version = cache.get(VERSION_KEY)
+        index = self._index
+        if not self._is_stale(version):
+            return index
+        with self._lock:
+            if self._is_stale(version):
+                self._index = self._build()
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._index
+
+    def warm_up(self):
+        self._get_index()
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self._index = None
+
+    def get_many(self, ids):
+        """Словарь {id: Ingredient} для найденных id, как in_bulk."""
+        _, _, by_id = self._get_index()
+        return {pk: by_id[pk] for pk in ids if pk in by_id}
+
+    def search(self, query, limit):
+        """Ищет ингредиенты по названию без учёта регистра и ё/е.
+
+        Сначала идут точные совпадения, затем совпадения по префиксу,
+        затем вхождения подстроки в любом месте названия.
+        """
+        keys, ingredients, _ = self._get_index()
+        query = normalize(query)
+        if not query:
+            return ingredients[:limit]
+
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\uffff', lo=start)
+        results = ingredients[start:end][:limit]
+        if len(results) >= limit:
+            return results
+
+        substring = [
+            (key.find(query), index)
+            for index, key in enumerate(keys)
+            if (index < start or index >= end) and query in key
+        ]
+        substring.sort()
+        results.extend(
+            ingredients[index]
+            for _, index in substring[:limit - len(results)]
+        )
+        return results
+
+
+ingredient_catalogue = IngredientCatalogue()
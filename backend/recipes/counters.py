@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+BATCH_SIZE = 5000
+
+# Поле field модели model хранит число строк source, ссылающихся
+# на неё через внешний ключ source_field.
+Counter = namedtuple('Counter', 'model field source source_field')
+
+COUNTERS = (
+    Counter(Recipe, 'favorites_count', Favorite, 'recipe'),
+    Counter(Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    Counter(User, 'recipes_count', Recipe, 'author'),
+    Counter(User, 'followers_count', Follow, 'following'),
+)
+
+
+def adjust(source, instance, delta):
+    """Изменяет на delta счётчики, которые считают строки source.
+    Значение меняется в базе через F(), без чтения в Python, поэтому
+    одновременные запросы не теряют изменения друг друга."""
+
+    for counter in COUNTERS:
+        if counter.source is not source:
+            continue
+        counter.model.objects.filter(
+            pk=getattr(instance, f'{counter.source_field}_id')
+        ).update(**{
+            counter.field: Greatest(F(counter.field) + delta, Value(0))
+        })
+
+
+def adjust_targets(source, target_ids, delta):
+    """Как adjust, но сразу для нескольких объектов, на которые
+    ссылаются удалённые или созданные строки source: каждая строка
+    ссылается на свой объект, поэтому хватает одного UPDATE."""
+
+    for counter in COUNTERS:
+        if counter.source is not source:
+            continue
+        counter.model.objects.filter(pk__in=target_ids).update(**{
+            counter.field: Greatest(F(counter.field) + delta, Value(0))
+        })
+
+
+def actual_count(counter):
+    """Выражение с фактическим числом строк для счётчика."""
+
+    rows = counter.source.objects.filter(
+        **{counter.source_field: OuterRef('pk')}
+    ).order_by().values(counter.source_field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def reconcile(counter, queryset=None, dry_run=False):
+    """Находит строки, у которых счётчик разошёлся с фактическим
+    числом, и пересчитывает их пакетами. Возвращает число таких строк."""
+
+    if queryset is None:
+        queryset = counter.model.objects.all()
+    drifted = list(queryset.annotate(
+        actual=actual_count(counter)
+    ).exclude(
+        **{counter.field: F('actual')}
+    ).order_by('pk').values_list('pk', flat=True))
+    if not dry_run:
+        for start in range(0, len(drifted), BATCH_SIZE):
+            counter.model.objects.filter(
+                pk__in=drifted[start:start + BATCH_SIZE]
+            ).update(**{counter.field: actual_count(counter)})
+    return len(drifted)
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow, User
+
+BATCH_SIZE = 5000
+
+
+def is_fanout_author(author_id):
+    """Рецепты автора раскладываются по лентам при публикации, если
+    подписчиков немного. Для популярных авторов это слишком много
+    записей на каждый рецепт, их рецепты лента выбирает при чтении."""
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).exists()
+
+
+def add_entries(user_ids, recipes):
+    """Добавляет рецепты (id, pub_date) в ленты пользователей."""
+
+    batch = []
+    for user_id in user_ids:
+        for recipe_id, pub_date in recipes:
+            batch.append(FeedEntry(
+                user_id=user_id, recipe_id=recipe_id, pub_date=pub_date
+            ))
+            if len(batch) >= BATCH_SIZE:
+                FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+
+    if not is_fanout_author(recipe.author_id):
+        return
+    add_entries(
+        Follow.objects.filter(following_id=recipe.author_id).values_list(
+            'user_id', flat=True
+        ),
+        [(recipe.pk, recipe.pub_date)]
+    )
+
+
+def backfill(user_ids, author_id):
+    """Добавляет в ленты пользователей уже опубликованные рецепты
+    автора: после подписки или когда автор снова перестал быть
+    популярным."""
+
+    if not is_fanout_author(author_id):
+        return
+    add_entries(user_ids, list(
+        Recipe.objects.filter(author_id=author_id).values_list(
+            'id', 'pub_date'
+        )
+    ))
+
+
+def backfill_followers(author_id):
+    backfill(list(
+        Follow.objects.filter(following_id=author_id).values_list(
+            'user_id', flat=True
+        )
+    ), author_id)
+
+
+def subscribe(user_id, author_ids):
+    """Добавляет в ленту пользователя рецепты сразу нескольких новых
+    подписок одним запросом."""
+
+    add_entries([user_id], list(
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('id', 'pub_date')
+    ))
+
+
+def remove(user_id, author_ids):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id__in=author_ids
+    ).delete()
+
+
+def restore_fanout(author_ids):
+    """Вызывается после отписки: если автор только что перестал быть
+    популярным, его рецепты раскладываются по лентам подписчиков."""
+
+    for author_id in User.objects.filter(
+        pk__in=author_ids,
+        followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', flat=True):
+        backfill_followers(author_id)
+
+
+def rebuild(authors=None):
+    """Заполняет ленты по рецептам авторов authors (по умолчанию всех),
+    например после массовой загрузки данных в обход сигналов.
+    Возвращает число обработанных авторов."""
+
+    if authors is None:
+        authors = User.objects.all()
+    author_ids = authors.filter(
+        followers_count__gt=0,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', flat=True)
+    total = 0
+    for author_id in author_ids.iterator():
+        backfill_followers(author_id)
+        total += 1
+    return total
+
+
+def before(position, date_field, id_field):
+    """Условие «строго после позиции (pub_date, id)» при сортировке
+    по убыванию."""
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(
+        **{date_field: pub_date, f'{id_field}__lt': pk}
+    )
+
+
+def get_feed(user, limit, position=None):
+    """Рецепты ленты пользователя, среди которых гарантированно есть
+    первые limit после позиции position в порядке (-pub_date, -id).
+
+    Лента складывается из двух источников: записей FeedEntry и рецептов
+    популярных авторов, выбранных через author_id IN (...) по индексу
+    recipe_author_pub_date_idx. Из каждого достаточно взять первые
+    limit строк, а окончательную сортировку и курсор применяет
+    пагинатор.
+    """
+
+    entries = FeedEntry.objects.filter(user=user)
+    popular_authors = list(User.objects.filter(
+        following__user=user,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', flat=True))
+    popular_recipes = Recipe.objects.filter(author__in=popular_authors)
+    if position is not None:
+        entries = entries.filter(before(position, 'pub_date', 'recipe_id'))
+        popular_recipes = popular_recipes.filter(
+            before(position, 'pub_date', 'id')
+        )
+    recipe_ids = list(entries.order_by('-pub_date', '-recipe_id').values_list(
+        'recipe_id', flat=True
+    )[:limit])
+    if popular_authors:
+        recipe_ids.extend(popular_recipes.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True)[:limit])
+    return Recipe.objects.filter(pk__in=recipe_ids)
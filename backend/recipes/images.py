@@ -0,0 +1,200 @@
+import base64
+import binascii
+import hashlib
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+CHUNK_SIZE = 64 * 1024
+# Пока декодированные данные меньше этого размера, они держатся в памяти.
+SPOOL_SIZE = 1024 * 1024
+# Сколько первых байт файла достаточно, чтобы прочитать заголовок.
+HEADER_LIMIT = 1024 * 1024
+HASH_LENGTH = 32
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+VARIANTS_DIR = 'variants'
+
+
+def hash_file(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - хэш его содержимого.
+
+    Повторная загрузка того же изображения не создаёт новый файл,
+    а возвращает имя уже сохранённого.
+    """
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, hash_file(content) + extension)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+image_storage = ContentHashStorage()
+
+
+def read_header(buffer):
+    """Возвращает (формат, размеры) по началу файла или None,
+    если заголовок ещё не получен целиком."""
+
+    position = buffer.tell()
+    buffer.seek(0)
+    try:
+        with Image.open(buffer, formats=list(EXTENSIONS)) as image:
+            return image.format, image.size
+    except (UnidentifiedImageError, SyntaxError, OSError, ValueError,
+            IndexError, struct.error):
+        return None
+    except Image.DecompressionBombError:
+        raise ValidationError('Изображение слишком большое.')
+    finally:
+        buffer.seek(position)
+
+
+def check_dimensions(size):
+    width, height = size
+    max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+    if width > max_dimension or height > max_dimension:
+        raise ValidationError(
+            f'Размер изображения не должен превышать '
+            f'{max_dimension}x{max_dimension} пикселей.'
+        )
+
+
+def decode_chunks(encoded, buffer):
+    """Пишет в buffer декодированные куски base64 и возвращает
+    формат изображения, прочитанный из заголовка."""
+
+    image_header = None
+    for start in range(0, len(encoded), CHUNK_SIZE):
+        try:
+            chunk = base64.b64decode(
+                encoded[start:start + CHUNK_SIZE], validate=True
+            )
+        except (binascii.Error, ValueError):
+            raise ValidationError('Некорректные данные base64.')
+        buffer.write(chunk)
+        if image_header is None and buffer.tell() <= HEADER_LIMIT:
+            image_header = read_header(buffer)
+            if image_header is not None:
+                check_dimensions(image_header[1])
+    if image_header is None:
+        raise ValidationError('Загрузите корректное изображение.')
+    return image_header[0]
+
+
+def verify_image(buffer):
+    """Проверяет целостность всего декодированного файла: заголовок
+    мог прочитаться и у обрезанного или повреждённого изображения."""
+
+    buffer.seek(0)
+    try:
+        with Image.open(buffer, formats=list(EXTENSIONS)) as image:
+            image.verify()
+    except Image.DecompressionBombError:
+        raise ValidationError('Изображение слишком большое.')
+    except Exception:
+        raise ValidationError('Загрузите корректное изображение.')
+    finally:
+        buffer.seek(0)
+
+
+def decode_base64_image(data):
+    """Декодирует изображение из data URI по частям.
+
+    Декодированные данные пишутся во временный файл. Превышение
+    RECIPE_IMAGE_MAX_SIZE видно ещё по длине строки, а формат и размеры
+    проверяются по заголовку, как только он декодирован, - до того,
+    как декодирован весь файл, а целостность - после декодирования.
+    Имя файла - хэш содержимого.
+    """
+
+    header, separator, encoded = data.partition(';base64,')
+    if not separator or not header.startswith('data:image/'):
+        raise ValidationError('Ожидается изображение в формате base64.')
+    max_size = settings.RECIPE_IMAGE_MAX_SIZE
+    if len(encoded) // 4 * 3 > max_size + 2:
+        raise ValidationError(
+            f'Размер файла не должен превышать {max_size} байт.'
+        )
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        image_format = decode_chunks(encoded, buffer)
+        verify_image(buffer)
+    except ValidationError:
+        buffer.close()
+        raise
+    image_file = File(buffer)
+    name = f'{hash_file(image_file)}.{EXTENSIONS[image_format]}'
+    image_file.name = name
+    return image_file
+
+
+def get_variant_names(name):
+    """Имена уменьшенных копий изображения: {размер: {формат: имя}}.
+
+    Имена выводятся из имени оригинала, то есть из хэша содержимого,
+    поэтому копии одинаковых изображений тоже общие.
+    """
+
+    if not name:
+        return {}
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return {
+        size: {
+            extension: os.path.join(
+                directory, VARIANTS_DIR, f'{stem}-{width}.{extension}'
+            )
+            for extension in VARIANT_FORMATS
+        }
+        for size, width in settings.RECIPE_IMAGE_VARIANTS.items()
+    }
+
+
+def render_variants(source, targets):
+    """Записывает уменьшенные копии изображения.
+
+    Выполняется в пуле процессов и не обращается к Django:
+    source - путь к оригиналу, targets - список (путь, ширина, формат).
+    """
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for path, width, image_format in targets:
+        variant = image.copy()
+        variant.thumbnail((width, width), Image.LANCZOS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        variant.save(temporary_path, image_format, quality=80)
+        os.replace(temporary_path, path)
+    return [path for path, _, _ in targets]
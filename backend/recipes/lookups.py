@@ -0,0 +1,24 @@
+from django.db.models import CharField, Lookup, TextField
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class TrigramContains(Lookup):
+    """Поиск подстроки без учёта регистра для PostgreSQL.
+
+    icontains превращается в UPPER(столбец) LIKE UPPER(...), и
+    GIN-индекс pg_trgm по самому столбцу для него не подходит. ILIKE
+    по столбцу этим индексом обслуживается.
+    """
+
+    lookup_name = 'trigram_contains'
+
+    def process_rhs(self, compiler, connection):
+        rhs, params = super().process_rhs(compiler, connection)
+        params[0] = f'%{connection.ops.prep_for_like_query(params[0])}%'
+        return rhs, params
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', lhs_params + rhs_params
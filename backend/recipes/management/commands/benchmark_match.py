@@ -0,0 +1,78 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from recipes.matching import MatchResults, PostingIndex
+
+
+class Command(BaseCommand):
+    help = ('Замеряет построение обратного индекса ингредиентов и поиск '
+            'рецептов по имеющимся ингредиентам на синтетических данных '
+            '(по умолчанию 1 000 000 рецептов) без обращения к базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--ingredient-skew', type=float, default=0.8)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--query-size', type=int, nargs=2,
+                            default=(3, 10), metavar=('MIN', 'MAX'))
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Сколько первых результатов ранжировать')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        weights = 1 / np.arange(
+            1, options['ingredients'] + 1
+        ) ** options['ingredient_skew']
+        weights /= weights.sum()
+
+        low, high = options['ingredients_per_recipe']
+        sizes = rng.integers(low, high + 1, size=options['recipes'])
+        recipe_column = np.repeat(np.arange(1, options['recipes'] + 1), sizes)
+        ingredient_column = rng.choice(
+            options['ingredients'], size=len(recipe_column), p=weights
+        ) + 1
+
+        started = time.perf_counter()
+        index = PostingIndex(recipe_column, ingredient_column)
+        self.stdout.write(
+            f'Индекс: {len(index.recipe_ids)} рецептов, '
+            f'{len(index.positions)} пар, '
+            f'{index.nbytes / 1024 ** 2:.1f} МиБ, построен за '
+            f'{time.perf_counter() - started:.2f} с'
+        )
+
+        low, high = options['query_size']
+        timings, found = [], []
+        for _ in range(options['queries']):
+            query = rng.choice(
+                options['ingredients'], size=rng.integers(low, high + 1),
+                replace=False, p=weights
+            ) + 1
+            started = time.perf_counter()
+            matched = index.count_matches(np.unique(query))
+            positions = np.flatnonzero(matched)
+            results = MatchResults(
+                index.recipe_ids[positions], matched[positions],
+                index.totals[positions]
+            )
+            results[:options['limit']]
+            timings.append(time.perf_counter() - started)
+            found.append(len(results))
+
+        timings_ms = sorted(timing * 1000 for timing in timings)
+        self.stdout.write(
+            f'Запросов: {len(timings_ms)}, найдено рецептов в среднем: '
+            f'{statistics.mean(found):.0f}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Время поиска, мс: p50 {statistics.median(timings_ms):.1f}, '
+            f'p95 {timings_ms[int(len(timings_ms) * 0.95) - 1]:.1f}, '
+            f'max {timings_ms[-1]:.1f}'
+        ))
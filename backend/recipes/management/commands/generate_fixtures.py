@@ -0,0 +1,305 @@
+import io
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes import counters, feed
+from recipes.images import image_storage
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import recipes_loaded
+from users.models import Follow, User
+
+PASSWORD = 'fixture-password'
+PLACEHOLDER_COLORS = (
+    '#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#56CCF2', '#EB5757',
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'паста', 'рагу', 'запеканка', 'каша', 'омлет',
+    'котлеты', 'блины', 'плов', 'борщ', 'гуляш', 'соус', 'десерт', 'торт',
+    'домашний', 'быстрый', 'острый', 'сливочный', 'овощной', 'постный',
+)
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+
+
+class PowerLaw:
+    """Выбор элементов с вероятностью, убывающей как 1 / rank ** exponent.
+
+    Ранги назначаются случайной перестановке, поэтому самые популярные
+    элементы не совпадают с самыми старыми. exponent=0 даёт
+    равномерное распределение.
+    """
+
+    def __init__(self, population, exponent, rng):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+        self.rng = rng
+
+    def sample(self, k):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=k
+        )
+
+
+@contextmanager
+def explicit_dates(model, *names):
+    """Позволяет задать значения полей auto_now/auto_now_add в bulk_create."""
+
+    fields = [model._meta.get_field(name) for name in names]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def new_ids(model, last_id):
+    return list(model.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True))
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+class Command(BaseCommand):
+    help = ('Создаёт пользователей, рецепты, подписки, избранное и корзины '
+            'для нагрузочного тестирования. Авторы, подписки и популярность '
+            'рецептов распределены по степенному закону; при одном и том '
+            'же --seed данные воспроизводятся.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--tags-per-recipe', type=int, nargs=2,
+                            default=(1, 3), metavar=('MIN', 'MAX'))
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=3)
+        parser.add_argument('--author-skew', type=float, default=1.1,
+                            help='Показатель степени для числа рецептов '
+                                 'и подписчиков автора')
+        parser.add_argument('--popularity-skew', type=float, default=1.0,
+                            help='Показатель степени для популярности '
+                                 'рецептов в избранном и корзинах')
+        parser.add_argument('--ingredient-skew', type=float, default=0.8)
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределены даты '
+                                 'публикации')
+        parser.add_argument('--prefix', default='fixture')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(
+            username__startswith=f'{options["prefix"]}-'
+        ).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                f'укажите другой --prefix'
+            )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Сначала загрузите ингредиенты: '
+                               'manage.py load_ingredients')
+
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = time.perf_counter()
+        with transaction.atomic():
+            last_ids = {User: last_id(User), Recipe: last_id(Recipe)}
+            user_ids = self.create_users()
+            authors = PowerLaw(user_ids, options['author_skew'], self.rng)
+            recipe_ids = self.create_recipes(authors, ingredient_ids)
+            self.create_follows(user_ids, authors)
+            recipes = PowerLaw(recipe_ids, options['popularity_skew'],
+                               self.rng)
+            self.create_relations(Favorite, user_ids, recipes,
+                                  options['favorites_per_user'])
+            self.create_relations(ShoppingCart, user_ids, recipes,
+                                  options['carts_per_user'])
+            self.reconcile_counters(last_ids)
+            feed.rebuild(User.objects.filter(id__gt=last_ids[User]))
+            self.report('Ленты подписчиков заполнены')
+        recipes_loaded.send(sender=Recipe)
+        self.report('Готово. Уменьшенные копии изображений создаёт '
+                    'manage.py generate_image_variants, сортировку '
+                    'trending - manage.py update_trending')
+
+    def report(self, message):
+        self.stdout.write(
+            f'[{time.perf_counter() - self.started:7.1f} с] {message}'
+        )
+
+    def bulk_create(self, model, objects, **kwargs):
+        total = 0
+        for chunk in chunked(objects, self.batch_size):
+            model.objects.bulk_create(chunk, **kwargs)
+            total += len(chunk)
+        return total
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(PASSWORD)
+        start = last_id(User)
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}-{number}',
+                email=f'{prefix}-{number}@example.com',
+                first_name=self.rng.choice(WORDS).capitalize(),
+                last_name=f'{prefix.capitalize()}{number}',
+                password=password,
+            )
+            for number in range(self.options['users'])
+        ))
+        user_ids = new_ids(User, start)
+        self.report(f'Пользователей: {len(user_ids)}, пароль {PASSWORD}')
+        return user_ids
+
+    def create_placeholders(self):
+        names = []
+        for color in PLACEHOLDER_COLORS:
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), color).save(buffer, 'PNG')
+            names.append(image_storage.save(
+                'recipes/images/placeholder.png',
+                ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def get_tag_ids(self):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not tag_ids:
+            Tag.objects.bulk_create([
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in DEFAULT_TAGS
+            ])
+            tag_ids = list(Tag.objects.values_list('id', flat=True))
+        return tag_ids
+
+    def create_recipes(self, authors, ingredient_ids):
+        images = self.create_placeholders()
+        tag_ids = self.get_tag_ids()
+        ingredients = PowerLaw(
+            ingredient_ids, self.options['ingredient_skew'], self.rng
+        )
+        total = self.options['recipes']
+        now = timezone.now()
+        period = timedelta(days=self.options['days']).total_seconds()
+        recipe_ids = []
+        for offset in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - offset)
+            start = last_id(Recipe)
+            dates = sorted(
+                now - timedelta(seconds=self.rng.uniform(0, period))
+                for _ in range(size)
+            )
+            with explicit_dates(Recipe, 'pub_date', 'updated_at'):
+                Recipe.objects.bulk_create([
+                    Recipe(
+                        author_id=author_id,
+                        name=' '.join(self.rng.sample(WORDS, 2)).capitalize(),
+                        text=' '.join(self.rng.choices(WORDS, k=30)),
+                        cooking_time=self.rng.randint(5, 180),
+                        image=self.rng.choice(images),
+                        pub_date=date,
+                        updated_at=date,
+                    )
+                    for author_id, date in zip(authors.sample(size), dates)
+                ])
+            ids = new_ids(Recipe, start)
+            self.create_recipe_rows(ids, tag_ids, ingredients)
+            recipe_ids.extend(ids)
+            self.report(f'Рецептов: {len(recipe_ids)} из {total}')
+        return recipe_ids
+
+    def create_recipe_rows(self, recipe_ids, tag_ids, ingredients):
+        tags_range = self.options['tags_per_recipe']
+        ingredients_range = self.options['ingredients_per_recipe']
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, min(len(tag_ids), self.rng.randint(*tags_range))
+            )
+        ], batch_size=self.batch_size)
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in set(
+                ingredients.sample(self.rng.randint(*ingredients_range))
+            )
+        ], batch_size=self.batch_size)
+
+    def create_follows(self, user_ids, authors):
+        per_user = self.options['follows_per_user']
+        total = self.bulk_create(Follow, (
+            Follow(user_id=user_id, following_id=author_id)
+            for user_id in user_ids
+            for author_id in set(authors.sample(per_user)) - {user_id}
+        ))
+        self.report(f'Подписок: {total}')
+
+    def reconcile_counters(self, last_ids):
+        """bulk_create не вызывает сигналы, поэтому счётчики новых
+        пользователей и рецептов пересчитываются одним проходом."""
+
+        for counter in counters.COUNTERS:
+            counters.reconcile(counter, counter.model.objects.filter(
+                id__gt=last_ids[counter.model]
+            ))
+        self.report('Счётчики пересчитаны')
+
+    def create_relations(self, model, user_ids, recipes, per_user):
+        now = timezone.now()
+        period = timedelta(days=self.options['days']).total_seconds()
+        with explicit_dates(model, 'created'):
+            total = self.bulk_create(model, (
+                model(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    created=now - timedelta(
+                        seconds=self.rng.uniform(0, period)
+                    )
+                )
+                for user_id in user_ids
+                for recipe_id in set(recipes.sample(per_user))
+            ))
+        self.report(f'{model._meta.verbose_name_plural}: {total}')
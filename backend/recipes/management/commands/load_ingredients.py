@@ -1,36 +1,105 @@
+import csv
 import json
 import os
+import re
+import time
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
 from django.utils.translation import gettext as _
 
 from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json(file):
+    """Разбирает JSON-массив объектов по частям, не читая файл целиком."""
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError(_('Expected a JSON array of ingredients'))
+    position = 1
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError(_('Malformed JSON in ingredients file'))
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(('name', 'measurement_unit'), row))
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из data/*.json или data/*.csv. '
+            'Уже существующие пары (название, единица) пропускаются, '
+            'поэтому команду можно запускать повторно.')
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', type=int, default=5000)
 
     def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options['filename'])
+        parse = iter_csv if path.endswith('.csv') else iter_json
+        started = time.perf_counter()
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient["name"],
-                                                  measurement_unit=ingredient[
-                                                      "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ingredient {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'already added to the database')
-
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                with transaction.atomic():
+                    before = Ingredient.objects.count()
+                    rows = self.load(parse(file), options['batch_size'])
+                    created = Ingredient.objects.count() - before
         except FileNotFoundError:
             raise CommandError(_('The file is missing in the data folder'))
+
+        ingredients_loaded.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {rows}, добавлено ингредиентов: {created}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
+
+    def load(self, items, batch_size):
+        rows = 0
+        batch = []
+        for item in items:
+            try:
+                name = item['name'].strip()
+                measurement_unit = item['measurement_unit'].strip()
+            except (KeyError, TypeError, AttributeError):
+                raise CommandError(
+                    _('Invalid ingredient at row %s') % (rows + 1)
+                )
+            batch.append(
+                Ingredient(name=name, measurement_unit=measurement_unit)
+            )
+            rows += 1
+            if len(batch) >= batch_size:
+                self.flush(batch, rows)
+                batch = []
+        if batch:
+            self.flush(batch, rows)
+        return rows
+
+    def flush(self, batch, rows):
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        self.stdout.write(f'Обработано строк: {rows}')
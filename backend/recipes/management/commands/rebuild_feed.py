@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет ленты подписчиков рецептами авторов, у которых '
+            'не больше FEED_FANOUT_MAX_FOLLOWERS подписчиков. Нужна один '
+            'раз после появления лент и после загрузки данных в обход '
+            'сигналов; уже существующие записи пропускаются.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            authors = feed.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано авторов: {authors}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного, списков покупок, рецептов '
+            'и подписчиков с фактическим числом строк и исправляет '
+            'расхождения, например после массовых изменений в обход '
+            'сигналов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать число расхождений')
+
+    def handle(self, *args, **options):
+        total = 0
+        for counter in counters.COUNTERS:
+            with transaction.atomic():
+                drifted = counters.reconcile(
+                    counter, dry_run=options['dry_run']
+                )
+            total += drifted
+            self.stdout.write(
+                f'{counter.model._meta.model_name}.{counter.field}: '
+                f'расхождений {drifted}'
+            )
+        action = 'найдено' if options['dry_run'] else 'исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {action} расхождений: {total}'
+        ))
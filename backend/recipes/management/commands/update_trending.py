@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.signals import trending_updated
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сортировку ?ordering=trending по новым '
+            'добавлениям в избранное и списки покупок. Запускается '
+            'периодически, например из cron раз в несколько минут.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать оценки всех рецептов заново, '
+                                 'не дожидаясь TRENDING_FULL_INTERVAL_HOURS')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = update_trending(full=options['full'])
+        if updated:
+            trending_updated.send(sender=Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлений рецептов: {updated}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,254 @@
+import itertools
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from foodgram.routers import read_from_replicas
+from recipes.models import IngredientRecipe, Recipe
+
+VERSION_KEY = 'ingredient-match-version'
+# Не чаще этого интервала (в секундах) процесс спрашивает базу
+# о рецептах, изменённых после построения индекса.
+SYNC_INTERVAL = 1
+# Рецепт и его ингредиенты сохраняются разными запросами, поэтому
+# рецепты, изменённые за последнюю минуту, перечитываются повторно.
+SYNC_LAG = timedelta(minutes=1)
+# Когда изменённых рецептов больше, индекс строится заново.
+MAX_OVERLAY = 20000
+CHUNK_SIZE = 10000
+
+
+class PostingIndex:
+    """Неизменяемый обратный индекс «ингредиент -> рецепты» на массивах
+    numpy.
+
+    recipe_ids - отсортированные id рецептов, totals - число разных
+    ингредиентов каждого из них. Списки рецептов всех ингредиентов
+    лежат подряд в positions (номера в recipe_ids по возрастанию),
+    список ингредиента ingredient_ids[i] занимает
+    positions[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, recipe_column, ingredient_column):
+        self.recipe_ids, recipe_positions = np.unique(
+            recipe_column, return_inverse=True
+        )
+        self.ingredient_ids, ingredient_positions = np.unique(
+            ingredient_column, return_inverse=True
+        )
+        width = max(len(self.ingredient_ids), 1)
+        # np.sort с маской заметно быстрее np.unique на миллионах пар.
+        pairs = np.sort(
+            recipe_positions.astype(np.int64) * width + ingredient_positions
+        )
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+        recipe_positions = (pairs // width).astype(np.int32)
+        ingredient_positions = pairs % width
+        self.totals = np.bincount(
+            recipe_positions, minlength=len(self.recipe_ids)
+        ).astype(np.int32)
+        # Пары отсортированы по рецепту, устойчивая сортировка
+        # по ингредиенту сохраняет этот порядок внутри списков.
+        order = np.argsort(ingredient_positions, kind='stable')
+        self.positions = recipe_positions[order]
+        self.offsets = np.zeros(
+            len(self.ingredient_ids) + 1, dtype=np.int64
+        )
+        np.cumsum(
+            np.bincount(
+                ingredient_positions, minlength=len(self.ingredient_ids)
+            ),
+            out=self.offsets[1:]
+        )
+
+    @classmethod
+    def from_database(cls):
+        rows = IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by().iterator(chunk_size=CHUNK_SIZE)
+        pairs = np.fromiter(
+            itertools.chain.from_iterable(rows), dtype=np.int64
+        ).reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1])
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.recipe_ids, self.totals, self.ingredient_ids,
+            self.positions, self.offsets
+        ))
+
+    def count_matches(self, ingredient_ids):
+        """Число совпавших ингредиентов для каждого рецепта."""
+
+        found = np.searchsorted(self.ingredient_ids, ingredient_ids)
+        found = found[found < len(self.ingredient_ids)]
+        found = found[np.isin(self.ingredient_ids[found], ingredient_ids)]
+        if not len(found):
+            return np.zeros(len(self.recipe_ids), dtype=np.int64)
+        return np.bincount(
+            np.concatenate([
+                self.positions[self.offsets[i]:self.offsets[i + 1]]
+                for i in found
+            ]),
+            minlength=len(self.recipe_ids)
+        )
+
+
+class MatchResults:
+    """Рецепты, ранжированные по доле имеющихся ингредиентов, затем
+    по числу совпадений, затем от новых к старым.
+
+    Ведёт себя как последовательность кортежей (id рецепта, совпало,
+    всего ингредиентов) и сортирует только ту часть, которую просят,
+    поэтому подходит для Paginator.
+    """
+
+    def __init__(self, recipe_ids, matched, totals):
+        self.recipe_ids = recipe_ids
+        self.matched = matched
+        self.totals = totals
+        self.coverage = matched / np.maximum(totals, 1)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def top(self, limit):
+        """Номера первых limit рецептов в порядке ранжирования."""
+
+        candidates = np.arange(len(self))
+        if limit <= 0:
+            return candidates[:0]
+        if limit < len(self):
+            threshold = np.partition(
+                self.coverage, len(self) - limit
+            )[len(self) - limit]
+            candidates = candidates[self.coverage >= threshold]
+        order = np.lexsort((
+            -self.recipe_ids[candidates],
+            -self.matched[candidates],
+            -self.coverage[candidates],
+        ))
+        return candidates[order][:limit]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('MatchResults supports only slices')
+        start, stop, _ = key.indices(len(self))
+        return [
+            (int(self.recipe_ids[i]), int(self.matched[i]),
+             int(self.totals[i]))
+            for i in self.top(stop)[start:]
+        ]
+
+
+class IngredientMatchIndex:
+    """Поиск рецептов по имеющимся ингредиентам в памяти процесса.
+
+    Основа - PostingIndex по всем строкам IngredientRecipe, он строится
+    при первом обращении. Рецепты, изменённые после этого (по
+    Recipe.updated_at), перечитываются из базы и хранятся отдельно
+    в словаре overlay, а их строки в основе помечаются неактуальными.
+    Подсчёт совпадений по основе векторизован, overlay обходится
+    в Python и поэтому ограничен MAX_OVERLAY рецептами. Удалённые
+    рецепты остаются в индексе до перестроения, их отбрасывает
+    представление. Полное перестроение во всех процессах вызывает
+    invalidate(), например после массовой загрузки рецептов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._state = None
+        self._synced_at = 0
+
+    def _build(self):
+        started_at = timezone.now()
+        base = PostingIndex.from_database()
+        alive = np.ones(len(base.recipe_ids), dtype=bool)
+        return base, alive, {}, started_at
+
+    def _sync(self, state):
+        base, alive, overlay, since = state
+        started_at = timezone.now()
+        changed = list(Recipe.objects.filter(
+            updated_at__gte=since - SYNC_LAG
+        ).values_list('id', flat=True))
+        if not changed:
+            return base, alive, overlay, started_at
+        if len(overlay) + len(changed) > MAX_OVERLAY:
+            return self._build()
+
+        overlay = dict(overlay)
+        overlay.update((recipe_id, set()) for recipe_id in changed)
+        rows = IngredientRecipe.objects.filter(
+            recipe_id__in=changed
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            overlay[recipe_id].add(ingredient_id)
+        positions = np.searchsorted(base.recipe_ids, changed)
+        positions = positions[positions < len(base.recipe_ids)]
+        positions = positions[np.isin(base.recipe_ids[positions], changed)]
+        alive = alive.copy()
+        alive[positions] = False
+        return base, alive, overlay, started_at
+
+    def _get_state(self):
+        version = cache.get(VERSION_KEY)
+        state = self._state
+        if (
+            state is not None and version == self._version
+            and time.monotonic() - self._synced_at < SYNC_INTERVAL
+        ):
+            return state
+        # Построение и дочитывание изменений идут в основную базу:
+        # рецепты, которых ещё нет на отстающей реплике, не попали бы
+        # в индекс до следующего полного перестроения.
+        with self._lock, read_from_replicas(False):
+            if self._state is None or version != self._version:
+                self._state = self._build()
+                self._version = version
+            elif time.monotonic() - self._synced_at >= SYNC_INTERVAL:
+                self._state = self._sync(self._state)
+            self._synced_at = time.monotonic()
+            return self._state
+
+    def warm_up(self):
+        self._get_state()
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self._state = None
+
+    def search(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов,
+        в виде MatchResults."""
+
+        base, alive, overlay, _ = self._get_state()
+        query = np.unique(np.asarray(list(ingredient_ids), dtype=np.int64))
+        matched = base.count_matches(query)
+        found = np.flatnonzero((matched > 0) & alive)
+
+        wanted = set(query.tolist())
+        extra = [
+            (recipe_id, len(ingredients & wanted), len(ingredients))
+            for recipe_id, ingredients in overlay.items()
+            if not ingredients.isdisjoint(wanted)
+        ]
+        extra_ids, extra_matched, extra_totals = (
+            np.array(column, dtype=np.int64)
+            for column in (zip(*extra) if extra else ((), (), ()))
+        )
+        return MatchResults(
+            np.concatenate([base.recipe_ids[found], extra_ids]),
+            np.concatenate([matched[found], extra_matched]),
+            np.concatenate([base.totals[found], extra_totals]),
+        )
+
+
+match_index = IngredientMatchIndex()
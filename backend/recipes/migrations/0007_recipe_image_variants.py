@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-17 07:05
+
+from django.db import migrations, models
+import recipes.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии изображения'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, null=True, storage=recipes.images.ContentHashStorage(), upload_to='recipes/images/'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite',
+     'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count', 'recipes', 'ShoppingCart',
+     'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, source_app, source, source_field in COUNTERS:
+        rows = apps.get_model(source_app, source).objects.filter(
+            **{source_field: OuterRef('pk')}
+        ).order_by().values(source_field).annotate(
+            total=Count('pk')
+        ).values('total')
+        apps.get_model(app, model).objects.update(
+            **{field: Coalesce(Subquery(rows), Value(0))}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_unique_ingredient'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
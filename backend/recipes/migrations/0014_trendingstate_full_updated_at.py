@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trendingstate',
+            name='full_updated_at',
+            field=models.DateTimeField(blank=True, help_text='Момент, по который события учтены последним полным пересчётом', null=True, verbose_name='Полный пересчёт'),
+        ),
+    ]
@@ -1,8 +1,16 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
 from django.core import validators
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef,
+                              Prefetch, Q, Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
-from users.models import User
+from recipes import lookups  # noqa: F401 регистрирует trigram_contains
+from recipes.images import image_storage
+from users.models import Follow, User
 
 
 class Ingredient(models.Model):
@@ -18,6 +26,12 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -58,6 +72,102 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        """Подгружает тэги, ингредиенты и автора фиксированным числом
+        запросов и аннотирует рецепты флагами is_favorited,
+        is_in_shopping_cart и флагом is_subscribed у автора."""
+        queryset = self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+        if not user.is_authenticated:
+            return queryset.select_related('author')
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            )
+        ).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(
+                    is_subscribed=Exists(
+                        Follow.objects.filter(
+                            user=user, following=OuterRef('pk')
+                        )
+                    )
+                )
+            )
+        )
+
+    def search(self, query):
+        """Поиск по названию и описанию с ранжированием.
+
+        В PostgreSQL условия trigram_contains (ILIKE) и trigram_similar
+        обслуживаются GIN-индексами pg_trgm, ранг складывается из
+        полнотекстового SearchRank и триграммной близости названия.
+        В остальных СУБД используется icontains, а выше ранжируются
+        совпадения в начале названия.
+        """
+        query = query.strip()
+        if not query:
+            return self
+        if connections[self.db].vendor == 'postgresql':
+            vector = (
+                SearchVector('name', weight='A', config='russian')
+                + SearchVector('text', weight='B', config='russian')
+            )
+            rank = (
+                SearchRank(vector, SearchQuery(query, config='russian'))
+                + TrigramSimilarity('name', query)
+            )
+            matches = (
+                Q(name__trigram_contains=query)
+                | Q(text__trigram_contains=query)
+                | Q(name__trigram_similar=query)
+            )
+        else:
+            matches = Q(name__icontains=query) | Q(text__icontains=query)
+            rank = Case(
+                When(name__iexact=query, then=Value(3)),
+                When(name__istartswith=query, then=Value(2)),
+                When(name__icontains=query, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        return self.filter(matches).annotate(rank=rank).order_by(
+            '-rank', '-pub_date', '-id'
+        )
+
+    def latest_per_author(self, authors, limit):
+        """Оставляет не более limit последних рецептов каждого автора.
+
+        Нумерация считается одним запросом через ROW_NUMBER() OVER
+        (PARTITION BY author_id); Django 3.2 не умеет фильтровать по
+        оконным функциям, поэтому нумерованная выборка подставляется
+        как подзапрос.
+        """
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            author_position=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )
+        ).values('id', 'author_position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE author_position <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=200,
@@ -109,14 +219,73 @@ class Recipe(models.Model):
         db_index=True
     )
 
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=image_storage,
         null=True,
         default=None
     )
 
+    image_variants = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+
+    trending_score = models.FloatField(
+        'Популярность за последнее время',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_idx'
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                name='recipe_cooking_time_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['updated_at'],
+                name='recipe_updated_at_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -148,6 +317,12 @@ class IngredientRecipe(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                name='ingredient_recipe_idx'
+            )
+        ]
         verbose_name = 'Ингредиенты рецептов'
         verbose_name_plural = 'Ингредиенты рецептов'
 
@@ -173,6 +348,12 @@ class Favorite(models.Model):
         verbose_name='Рецепт',
         help_text='Выберите рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        null=True,
+        db_index=True
+    )
 
     class Meta:
         constraints = [
@@ -203,6 +384,12 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт',
         help_text='Выберите рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        null=True,
+        db_index=True
+    )
 
     class Meta:
         constraints = [
@@ -219,3 +406,65 @@ class ShoppingCart(models.Model):
             f'--{self.user}'
             f'-- wants to buy ingredients from the recipe --{self.recipe}--'
         )
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика. Строки добавляются при публикации
+    рецептов авторами, у которых не больше FEED_FANOUT_MAX_FOLLOWERS
+    подписчиков; рецепты остальных авторов лента выбирает при чтении."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            )
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'--{self.recipe}-- в ленте --{self.user}--'
+
+
+class TrendingState(models.Model):
+    """Состояние пересчёта Recipe.trending_score командой
+    update_trending. В таблице одна строка."""
+
+    epoch = models.DateTimeField(
+        'Начало отсчёта',
+        help_text='Момент, к которому приведены значения trending_score'
+    )
+    processed_until = models.DateTimeField('Учтены события до')
+    full_updated_at = models.DateTimeField(
+        'Полный пересчёт', null=True, blank=True,
+        help_text='Момент, по который события учтены последним полным '
+                  'пересчётом'
+    )
+
+    class Meta:
+        verbose_name = 'Состояние пересчёта популярности'
+        verbose_name_plural = 'Состояние пересчёта популярности'
+
+    def __str__(self):
+        return f'{self.epoch} - {self.processed_until}'
@@ -0,0 +1,144 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from recipes import counters, feed
+from recipes.catalogue import ingredient_catalogue
+from recipes.images import get_variant_names
+from recipes.matching import match_index
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow, User
+
+# Отправляется после массового изменения IngredientRecipe рецепта:
+# bulk_create и bulk_update не вызывают post_save.
+ingredients_changed = Signal()
+# Отправляется после массовой загрузки ингредиентов командой
+# load_ingredients.
+ingredients_loaded = Signal()
+# Отправляется после массового создания рецептов командой
+# generate_fixtures.
+recipes_loaded = Signal()
+# Отправляется после пересчёта Recipe.trending_score командой
+# update_trending.
+trending_updated = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(ingredients_loaded, sender=Ingredient)
+def invalidate_ingredient_catalogue(sender, **kwargs):
+    ingredient_catalogue.invalidate()
+
+
+@receiver(recipes_loaded, sender=Recipe)
+def invalidate_match_index(sender, **kwargs):
+    """Массово созданные рецепты могут иметь updated_at в прошлом,
+    поэтому индекс строится заново, а не дополняется."""
+    match_index.invalidate()
+
+
+def touch_recipes(**filters):
+    """Сдвигает updated_at рецептов, чьё представление в API изменилось
+    вместе со связанным тегом, ингредиентом или автором."""
+    Recipe.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, **kwargs):
+    touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, **kwargs):
+    touch_recipes(recipe_ingredients__ingredient=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    if created or (
+        update_fields and set(update_fields) <= {'last_login', 'password'}
+    ):
+        return
+    touch_recipes(author=instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_image_variants(sender, instance, **kwargs):
+    """Копии от прежнего изображения не отдаются с новым."""
+    if instance.image_variants != get_variant_names(instance.image.name):
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает счётчик рецептов автора. bulk_create
+    и QuerySet.update сигналов не вызывают: после них счётчики
+    пересчитывает counters.reconcile."""
+    if created and not raw:
+        counters.adjust(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    counters.adjust(sender, instance, -1)
+
+
+def relations_created(model, user_id, target_ids):
+    """Поправляет счётчики и ленты после создания связей пользователя
+    с target_ids через Favorite, ShoppingCart или Follow. Вызывается
+    из post_save и из api.services.relations, где строки вставляются
+    без сигналов."""
+
+    counters.adjust_targets(model, target_ids, 1)
+    if model is Follow:
+        feed.subscribe(user_id, target_ids)
+
+
+def relations_deleted(model, user_id, target_ids):
+    """Поправляет счётчики и ленты после удаления связей пользователя
+    с target_ids через Favorite, ShoppingCart или Follow. Вызывается
+    из post_delete и из api.services.relations, где строки удаляются
+    без сигналов.
+
+    Ленты правятся после счётчиков: если автор только что перестал
+    быть популярным, его рецепты раскладываются по лентам.
+    """
+
+    counters.adjust_targets(model, target_ids, -1)
+    if model is Follow:
+        feed.remove(user_id, target_ids)
+        feed.restore_fanout(target_ids)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_relation(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        relations_created(sender, instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def remove_recipe_relation(sender, instance, **kwargs):
+    relations_deleted(sender, instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        relations_created(sender, instance.user_id, [instance.following_id])
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow(sender, instance, **kwargs):
+    relations_deleted(sender, instance.user_id, [instance.following_id])
@@ -0,0 +1,119 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ShoppingCart, TrendingState
+
+# Вес события каждого вида в оценке.
+EVENTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 1.0),
+)
+# События с более ранней датой могут быть ещё не зафиксированы
+# транзакцией, поэтому учитываются со следующего запуска.
+COMMIT_LAG = timedelta(minutes=1)
+# При полном пересчёте учитываются события за столько периодов
+# полураспада: вклад более старых меньше 0.1%.
+FULL_WINDOW_HALF_LIVES = 10
+# Через столько периодов полураспада значения приводятся к новому
+# началу отсчёта, чтобы не выйти за пределы float.
+REBASE_HALF_LIVES = 64
+BATCH_SIZE = 500
+
+
+def get_half_life():
+    return timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+
+
+def get_decay_rate():
+    return math.log(2) / get_half_life().total_seconds()
+
+
+def collect_scores(since, until, epoch):
+    """Вклад событий из промежутка (since, until] по рецептам.
+
+    Событие с датой t весит weight * exp(rate * (t - epoch)). Настоящая
+    оценка на момент now отличается от суммы таких весов множителем
+    exp(-rate * (now - epoch)), общим для всех рецептов, поэтому порядок
+    по trending_score совпадает с порядком по затухающей оценке, а
+    старые суммы не нужно пересчитывать при каждом запуске.
+    """
+
+    rate = get_decay_rate()
+    scores = defaultdict(float)
+    for model, weight in EVENTS:
+        events = model.objects.filter(
+            created__gt=since, created__lte=until
+        ).values_list('recipe_id', 'created')
+        for recipe_id, created in events.iterator():
+            scores[recipe_id] += weight * math.exp(
+                rate * (created - epoch).total_seconds()
+            )
+    return scores
+
+
+def add_scores(scores):
+    items = sorted(scores.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start:start + BATCH_SIZE]
+        Recipe.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            trending_score=F('trending_score') + Case(
+                *(When(pk=pk, then=Value(score)) for pk, score in batch),
+                output_field=FloatField()
+            )
+        )
+
+
+def rebase(state, epoch):
+    factor = math.exp(
+        -get_decay_rate() * (epoch - state.epoch).total_seconds()
+    )
+    Recipe.objects.exclude(trending_score=0).update(
+        trending_score=F('trending_score') * factor
+    )
+    state.epoch = epoch
+
+
+def is_full_update_due(state):
+    return state.full_updated_at is None or (
+        timezone.now() - state.full_updated_at
+        >= timedelta(hours=settings.TRENDING_FULL_INTERVAL_HOURS)
+    )
+
+
+def update_trending(full=False):
+    """Добавляет к Recipe.trending_score вклад событий, появившихся
+    с прошлого запуска. Возвращает число обновлений строк Recipe.
+
+    Удалённые события из суммы не вычитаются: строк уже нет. Поэтому
+    раз в TRENDING_FULL_INTERVAL_HOURS, как и при full=True, оценки
+    обнуляются и пересчитываются по событиям последних
+    FULL_WINDOW_HALF_LIVES периодов полураспада.
+    """
+
+    until = timezone.now() - COMMIT_LAG
+    window_start = until - get_half_life() * FULL_WINDOW_HALF_LIVES
+    with transaction.atomic():
+        state, created = TrendingState.objects.select_for_update(
+        ).get_or_create(pk=1, defaults={
+            'epoch': until, 'processed_until': window_start
+        })
+        reset = 0
+        if created or full or is_full_update_due(state):
+            reset = Recipe.objects.exclude(trending_score=0).update(
+                trending_score=0
+            )
+            state.epoch, state.processed_until = until, window_start
+            state.full_updated_at = until
+        elif until - state.epoch > get_half_life() * REBASE_HALF_LIVES:
+            rebase(state, until)
+        scores = collect_scores(state.processed_until, until, state.epoch)
+        add_scores(scores)
+        state.processed_until = until
+        state.save()
+    return reset + len(scores)
@@ -0,0 +1,79 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name=username, last_name=username, password='Pa55word!'
+    )
+
+
+@pytest.fixture
+def user(db):
+    return create_user('user')
+
+
+@pytest.fixture
+def author(db):
+    return create_user('author')
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def tags(db):
+    return [
+        Tag.objects.create(
+            name=f'Тег {i}', slug=f'tag-{i}', color=f'#00000{i}'
+        )
+        for i in range(3)
+    ]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(10)
+    ]
+
+
+@pytest.fixture
+def make_recipes(tags, ingredients):
+    def make_recipes(author, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10
+            )
+            recipe.tags.set(tags[:2])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients[:3]
+            )
+            recipes.append(recipe)
+        return recipes
+    return make_recipes
@@ -0,0 +1,7 @@
+from django.core.management import call_command
+
+
+def test_api_stays_within_budgets(db):
+    # Время зависит от машины CI, поэтому сверяются только число
+    # запросов и память; команда падает с CommandError при превышении.
+    call_command('benchmark_api', '--no-time', '--samples', '1')
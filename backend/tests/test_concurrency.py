@@ -0,0 +1,73 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+THREADS = 8
+
+pytestmark = pytest.mark.skipif(
+    settings.DATABASES['default']['ENGINE']
+    != 'django.db.backends.postgresql',
+    reason='Нужны параллельные транзакции PostgreSQL'
+)
+
+
+def run_concurrently(user, method, path):
+    """Выполняет один и тот же запрос из THREADS потоков одновременно
+    и возвращает счётчик кодов ответа."""
+
+    barrier = threading.Barrier(THREADS)
+
+    def send(_):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            barrier.wait()
+            return getattr(client, method)(path).status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        return Counter(executor.map(send, range(THREADS)))
+
+
+def test_concurrent_favorite_toggles(
+    transactional_db, user, author, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    path = f'/api/recipes/{recipe.id}/favorite/'
+
+    assert run_concurrently(user, 'post', path) == {
+        201: 1, 400: THREADS - 1
+    }
+    assert Favorite.objects.filter(user=user, recipe=recipe).count() == 1
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 1
+
+    assert run_concurrently(user, 'delete', path) == {
+        204: 1, 400: THREADS - 1
+    }
+    assert not Favorite.objects.exists()
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 0
+
+
+def test_concurrent_subscribe_toggles(transactional_db, user, author):
+    path = f'/api/users/{author.id}/subscribe/'
+
+    assert run_concurrently(user, 'post', path) == {
+        201: 1, 400: THREADS - 1
+    }
+    assert Follow.objects.filter(user=user, following=author).count() == 1
+    assert User.objects.get(pk=author.pk).followers_count == 1
+
+    assert run_concurrently(user, 'delete', path) == {
+        204: 1, 400: THREADS - 1
+    }
+    assert not Follow.objects.exists()
+    assert User.objects.get(pk=author.pk).followers_count == 0
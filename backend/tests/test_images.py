@@ -0,0 +1,34 @@
+import base64
+import io
+
+import pytest
+from django.core.exceptions import ValidationError
+from PIL import Image
+
+from recipes.images import decode_base64_image
+
+
+def encode_png(width=64, height=64):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def as_data_uri(content):
+    return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+
+def test_decode_base64_image_accepts_valid_image():
+    image_file = decode_base64_image(as_data_uri(encode_png()))
+    assert image_file.name.endswith('.png')
+    with Image.open(image_file) as image:
+        assert image.size == (64, 64)
+
+
+@pytest.mark.parametrize('damage', [
+    lambda content: content[:len(content) // 2],
+    lambda content: content[:-20] + bytes(20),
+], ids=['truncated', 'corrupted'])
+def test_decode_base64_image_rejects_damaged_image(damage):
+    with pytest.raises(ValidationError):
+        decode_base64_image(as_data_uri(damage(encode_png())))
@@ -0,0 +1,39 @@
+import json
+import logging
+
+import pytest
+
+
+@pytest.mark.parametrize('token, header, status', [
+    ('', None, 404),
+    ('', 'Bearer ', 404),
+    ('secret', None, 403),
+    ('secret', 'Bearer wrong', 403),
+    ('secret', 'Bearer secret', 200),
+])
+def test_metrics_require_token(settings, client, token, header, status):
+    settings.METRICS_ENABLED = True
+    settings.METRICS_TOKEN = token
+    headers = {} if header is None else {'HTTP_AUTHORIZATION': header}
+    assert client.get('/api/metrics', **headers).status_code == status
+
+
+def test_profiling_reports_slow_requests(
+    settings, client, tags, tmp_path, caplog
+):
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 1
+    settings.PROFILING_DIR = str(tmp_path)
+    settings.PROFILING_MAX_QUERIES = 0
+    with caplog.at_level(logging.INFO, logger='foodgram.profiling'):
+        response = client.get('/api/tags/')
+
+    assert response.status_code == 200
+    assert response['Server-Timing'].startswith('db;dur=')
+    record, = caplog.records
+    assert record.levelno == logging.WARNING
+    report = json.loads(record.getMessage())
+    assert report['path'] == '/api/tags/'
+    assert report['queries'] >= 1
+    assert report['flags'] == ['queries']
+    assert [str(path) for path in tmp_path.iterdir()] == [report['profile']]
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, TrendingState
+from recipes.trending import update_trending
+
+
+def test_removed_favorites_leave_trending_after_full_update(
+    user, author, make_recipes
+):
+    liked, other = make_recipes(author, 2)
+    Favorite.objects.create(user=user, recipe=liked)
+    Favorite.objects.filter(recipe=liked).update(
+        created=timezone.now() - timedelta(minutes=10)
+    )
+    update_trending()
+    liked.refresh_from_db()
+    assert liked.trending_score > 0
+
+    Favorite.objects.filter(recipe=liked).delete()
+    update_trending()
+    liked.refresh_from_db()
+    assert liked.trending_score > 0
+
+    TrendingState.objects.update(
+        full_updated_at=timezone.now() - timedelta(hours=2)
+    )
+    assert update_trending()
+    assert not Recipe.objects.exclude(trending_score=0).exists()
+
+
+def test_popular_ordering_is_not_served_from_stale_cache(
+    api_client, user, author, make_recipes
+):
+    first, second = make_recipes(author, 2)
+    Favorite.objects.create(user=user, recipe=first)
+    response = api_client.get('/api/recipes/?ordering=popular')
+    assert response.json()['results'][0]['id'] == first.id
+
+    Favorite.objects.create(user=author, recipe=second)
+    Favorite.objects.create(user=user, recipe=second)
+    response = api_client.get('/api/recipes/?ordering=popular')
+    assert response.json()['results'][0]['id'] == second.id
@@ -0,0 +1,387 @@
+import base64
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from foodgram.routers import ReplicaRouter
+from recipes.catalogue import ingredient_catalogue
+from recipes.images import get_variant_names
+from recipes.management.commands import load_ingredients
+from recipes.matching import match_index
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+
+@pytest.mark.parametrize('client_name', ['api_client', 'user_client'])
+def test_recipe_list_queries_do_not_grow_with_page_size(
+    request, client_name, user, author, make_recipes,
+    django_assert_num_queries
+):
+    recipes = make_recipes(author, 25)
+    Follow.objects.create(user=user, following=author)
+    for recipe in recipes[::2]:
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    client = request.getfixturevalue(client_name)
+
+    with CaptureQueriesContext(connection) as small_page:
+        response = client.get('/api/recipes/?limit=2')
+    assert len(response.json()['results']) == 2
+
+    with django_assert_num_queries(len(small_page)):
+        response = client.get('/api/recipes/?limit=20')
+    results = response.json()['results']
+    assert len(results) == 20
+    assert all(len(recipe['ingredients']) == 3 for recipe in results)
+    if client_name == 'user_client':
+        assert any(recipe['is_favorited'] for recipe in results)
+        assert all(recipe['author']['is_subscribed'] for recipe in results)
+
+
+@pytest.mark.parametrize('client_name', ['api_client', 'user_client'])
+def test_recipe_detail_with_non_numeric_id_is_not_found(
+    request, client_name
+):
+    client = request.getfixturevalue(client_name)
+    assert client.get('/api/recipes/abc/').status_code == 404
+
+
+def test_only_recipe_detail_has_last_modified(
+    api_client, author, make_recipes, django_capture_on_commit_callbacks
+):
+    kept, deleted = make_recipes(author, 2)
+    response = api_client.get('/api/recipes/')
+    assert 'Last-Modified' not in response
+    etag = response['ETag']
+    assert 'Last-Modified' in api_client.get(f'/api/recipes/{kept.id}/')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        deleted.delete()
+    response = api_client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [recipe['id'] for recipe in response.json()['results']] == [
+        kept.id
+    ]
+
+
+def test_create_recipe_with_ingredient_missing_from_catalogue(
+    settings, tmp_path, user_client, tags, ingredients
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    ingredient_catalogue.warm_up()
+    # bulk_create не отправляет сигналов, и каталог о нём не знает,
+    # как каталог другого процесса без общего кэша.
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='Новый ингредиент', measurement_unit='г')]
+    )
+    new = Ingredient.objects.get(name='Новый ингредиент')
+    image = io.BytesIO()
+    Image.new('RGB', (8, 8), 'green').save(image, 'PNG')
+
+    response = user_client.post('/api/recipes/', {
+        'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': new.id, 'amount': 10},
+            {'id': ingredients[0].id, 'amount': 1},
+        ],
+        'image': 'data:image/png;base64,'
+                 + base64.b64encode(image.getvalue()).decode(),
+    }, format='json')
+
+    assert response.status_code == 201, response.json()
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    assert set(recipe.ingredients.values_list('id', flat=True)) == {
+        new.id, ingredients[0].id
+    }
+
+
+@pytest.mark.parametrize('query, accept, file_format, first_line', [
+    ('?format=csv', None, 'csv', 'name,measurement_unit,amount'),
+    ('?format=txt', None, 'txt', 'Cписок покупок:'),
+    ('', 'text/csv', 'csv', 'name,measurement_unit,amount'),
+    ('', 'text/plain', 'txt', 'Cписок покупок:'),
+])
+def test_download_shopping_cart_text_formats(
+    user, user_client, author, make_recipes, query, accept, file_format,
+    first_line
+):
+    for recipe in make_recipes(author, 2):
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    headers = {} if accept is None else {'HTTP_ACCEPT': accept}
+    response = user_client.get(
+        f'/api/recipes/download_shopping_cart/{query}', **headers
+    )
+    assert response.status_code == 200
+    assert response['Content-Disposition'] == (
+        f'attachment; filename="my_shopping_cart.{file_format}"'
+    )
+    lines = response.content.decode().splitlines()
+    assert lines[0] == first_line
+    assert len(lines) == 4
+    assert all(line.endswith('3 г') or line.endswith(',г,3')
+               for line in lines[1:])
+
+
+def test_download_shopping_cart_json_and_default_pdf(
+    user, user_client, author, make_recipes
+):
+    for recipe in make_recipes(author, 2):
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    url = '/api/recipes/download_shopping_cart/'
+
+    response = user_client.get(f'{url}?format=json')
+    assert response['Content-Type'] == 'application/json'
+    assert response.json() == [
+        {'name': f'Ингредиент {i}', 'measurement_unit': 'г', 'amount': 3}
+        for i in range(3)
+    ]
+
+    response = user_client.get(url)
+    assert response['Content-Type'] == 'application/pdf'
+    assert response.content.startswith(b'%PDF')
+
+
+def test_ingredient_autocomplete_uses_fresh_catalogue(
+    db, api_client, django_assert_num_queries
+):
+    for name in ('Сахар', 'сахарная пудра', 'Ванильный сахар', 'Мёд'):
+        Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def search(name):
+        response = api_client.get('/api/ingredients/', {'name': name})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    assert search('мед') == ['Мёд']
+    with django_assert_num_queries(0):
+        assert search('САХ') == [
+            'Сахар', 'сахарная пудра', 'Ванильный сахар'
+        ]
+
+    Ingredient.objects.create(name='Сахарин', measurement_unit='г')
+    Ingredient.objects.filter(name='Сахар').delete()
+    assert search('сах') == ['Сахарин', 'сахарная пудра', 'Ванильный сахар']
+
+
+def test_recipe_search_ranks_name_matches_first(api_client, author):
+    for name, text in (
+        ('Борщ', 'Густой Суп со свёклой'),
+        ('Суп гороховый', 'Текст'),
+        ('Каша', 'Текст'),
+        ('Суп', 'Текст'),
+    ):
+        Recipe.objects.create(
+            author=author, name=name, text=text, cooking_time=10
+        )
+    response = api_client.get('/api/recipes/', {'search': 'Суп'})
+    assert [recipe['name'] for recipe in response.json()['results']] == [
+        'Суп', 'Суп гороховый', 'Борщ'
+    ]
+
+
+@pytest.mark.parametrize('filename, content', [
+    ('ingredients.json', json.dumps([
+        {'name': 'Соль', 'measurement_unit': 'г'},
+        {'name': 'Перец', 'measurement_unit': 'г'},
+        {'name': 'Соль', 'measurement_unit': 'г'},
+        {'name': 'Молоко', 'measurement_unit': 'мл'},
+    ], ensure_ascii=False)),
+    ('ingredients.csv', 'Соль,г\nПерец,г\nСоль,г\nМолоко,мл\n'),
+])
+def test_load_ingredients_is_idempotent(
+    db, api_client, tmp_path, monkeypatch, filename, content
+):
+    # Маленькие части, чтобы объекты JSON разрывались между ними.
+    monkeypatch.setattr(load_ingredients, 'CHUNK_SIZE', 16)
+    path = tmp_path / filename
+    path.write_text(content, encoding='utf-8')
+    Ingredient.objects.create(name='Перец', measurement_unit='г')
+    api_client.get('/api/ingredients/', {'name': 'мол'})
+
+    for _ in range(2):
+        call_command(
+            'load_ingredients', str(path), '--batch-size', '2',
+            stdout=io.StringIO()
+        )
+    assert sorted(Ingredient.objects.values_list(
+        'name', 'measurement_unit'
+    )) == [('Молоко', 'мл'), ('Перец', 'г'), ('Соль', 'г')]
+    response = api_client.get('/api/ingredients/', {'name': 'мол'})
+    assert [item['name'] for item in response.json()] == ['Молоко']
+
+
+def test_recipe_list_count_modes(api_client, author, make_recipes):
+    make_recipes(author, 7)
+    response = api_client.get('/api/recipes/?limit=3&count=none')
+    assert response.json()['count'] is None
+    assert response.json()['next'] is not None
+    response = api_client.get('/api/recipes/?limit=3&count=none&page=3')
+    assert len(response.json()['results']) == 1
+    assert response.json()['next'] is None
+
+    response = api_client.get('/api/recipes/?limit=3&count=estimate')
+    assert isinstance(response.json()['count'], int)
+
+
+def test_recipe_list_cursor_walks_all_recipes_once(
+    api_client, author, make_recipes
+):
+    recipes = make_recipes(author, 7)
+    Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]).update(
+        pub_date=recipes[0].pub_date
+    )
+    ids, url = [], '/api/recipes/?cursor=&limit=3'
+    while url:
+        data = api_client.get(url).json()
+        assert 'count' not in data
+        ids.extend(recipe['id'] for recipe in data['results'])
+        url = data['next']
+    assert ids == sorted((recipe.id for recipe in recipes), reverse=True)
+    assert api_client.get('/api/recipes/?cursor=bad').status_code == 404
+
+
+def test_generate_fixtures_is_reproducible(
+    settings, tmp_path, ingredients
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    names = []
+    for prefix in ('first', 'second'):
+        call_command(
+            'generate_fixtures', '--prefix', prefix, '--users', '5',
+            '--recipes', '12', '--batch-size', '4', '--seed', '7',
+            stdout=io.StringIO()
+        )
+        recipes = Recipe.objects.filter(author__username__startswith=prefix)
+        names.append(list(recipes.order_by('id').values_list(
+            'name', flat=True
+        )))
+        assert User.objects.filter(username__startswith=prefix).count() == 5
+        assert recipes.count() == 12
+        assert not recipes.filter(ingredients=None).exists()
+        assert not recipes.filter(image='').exists()
+    assert names[0] == names[1]
+
+    for recipe in Recipe.objects.annotate(
+        favorites_total=Count('favorites', distinct=True)
+    ):
+        assert recipe.favorites_count == recipe.favorites_total
+
+
+def test_match_ranks_by_coverage_then_matches_then_date(
+    api_client, author, ingredients
+):
+    recipes = {}
+    for name, positions in (
+        ('half', (0, 2)), ('full', (0, 1)), ('half-newer', (1, 3)),
+        ('other', (5,)), ('half-more', (0, 1, 2, 3)), ('full-one', (0,)),
+    ):
+        recipes[name] = Recipe.objects.create(
+            author=author, name=name, text='Текст', cooking_time=10
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipes[name],
+                             ingredient=ingredients[position], amount=1)
+            for position in positions
+        )
+    match_index.invalidate()
+    pantry = f'ingredients={ingredients[0].id}&ingredients={ingredients[1].id}'
+
+    response = api_client.get(f'/api/recipes/match/?{pantry}&limit=20')
+    assert [
+        (recipe['name'], recipe['coverage'], recipe['missing_ingredients'])
+        for recipe in response.json()['results']
+    ] == [
+        ('full', 1.0, 0), ('full-one', 1.0, 0), ('half-more', 0.5, 2),
+        ('half-newer', 0.5, 1), ('half', 0.5, 1),
+    ]
+    response = api_client.get(f'/api/recipes/match/?{pantry}&limit=2&page=2')
+    assert [recipe['name'] for recipe in response.json()['results']] == [
+        'half-more', 'half-newer'
+    ]
+
+
+def test_recipe_update_resets_variants_only_for_new_image(
+    settings, tmp_path, author, make_recipes
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    recipe, = make_recipes(author, 1)
+    client = APIClient()
+    client.force_authenticate(author)
+    path = f'/api/recipes/{recipe.id}/'
+
+    def png_uri(color):
+        image = io.BytesIO()
+        Image.new('RGB', (8, 8), color).save(image, 'PNG')
+        return ('data:image/png;base64,'
+                + base64.b64encode(image.getvalue()).decode())
+
+    assert client.patch(
+        path, {'image': png_uri('green')}, format='json'
+    ).status_code == 200
+    recipe.refresh_from_db()
+    variants = get_variant_names(recipe.image.name)
+    # Как после generate_image_variants.
+    Recipe.objects.filter(pk=recipe.pk).update(image_variants=variants)
+
+    with CaptureQueriesContext(connection) as queries:
+        client.patch(path, {'name': 'Новое название'}, format='json')
+    recipe.refresh_from_db()
+    assert recipe.name == 'Новое название'
+    assert recipe.image_variants == variants
+    updates = [
+        query['sql'] for query in queries if query['sql'].startswith('UPDATE')
+    ]
+    assert len(updates) == 1
+    assert '"image' not in updates[0]
+
+    client.patch(path, {'image': png_uri('blue')}, format='json')
+    recipe.refresh_from_db()
+    assert get_variant_names(recipe.image.name) != variants
+    assert recipe.image_variants == {}
+
+
+def test_shared_caches_are_filled_from_primary(
+    settings, monkeypatch, api_client, tags, author, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    ingredient_id = recipe.ingredients.values_list('id', flat=True)[0]
+    settings.DATABASE_REPLICAS = ['replica1']
+    db_for_read = ReplicaRouter.db_for_read
+    routed = []
+
+    def record_db_for_read(self, model, **hints):
+        routed.append((model, db_for_read(self, model, **hints)))
+        return 'default'
+
+    def get_aliases(path, params):
+        routed.clear()
+        assert api_client.get(path, params).status_code == 200
+        aliases = {}
+        for model, alias in routed:
+            aliases.setdefault(model, set()).add(alias)
+        return aliases
+
+    monkeypatch.setattr(ReplicaRouter, 'db_for_read', record_db_for_read)
+    ingredient_catalogue.invalidate()
+    match_index.invalidate()
+
+    assert get_aliases('/api/tags/', {}) == {Tag: {'default'}}
+    assert get_aliases('/api/tags/', {}) == {}
+    assert get_aliases('/api/ingredients/', {'name': 'ингр'}) == {
+        Ingredient: {'default'}
+    }
+    # Индекс строится по основной базе, а сами рецепты ответа
+    # читаются с реплики.
+    aliases = get_aliases(
+        '/api/recipes/match/', {'ingredients': ingredient_id}
+    )
+    assert 'default' in aliases[IngredientRecipe]
+    assert aliases[Recipe] == {'replica1'}
@@ -0,0 +1,112 @@
+import pytest
+
+from api.services import relations
+from recipes.models import Favorite, FeedEntry, Recipe
+from users.models import Follow, User
+
+
+@pytest.fixture(params=[True, False], ids=['returning', 'orm'])
+def returning(request, monkeypatch):
+    """Прогоняет тест и через INSERT/DELETE ... RETURNING, и через ORM,
+    которым пользуются СУБД без RETURNING."""
+    if not request.param:
+        monkeypatch.setattr(
+            relations, 'supports_returning', lambda connection: False
+        )
+    return request.param
+
+
+def test_favorite_toggle_updates_counter(
+    returning, user_client, author, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    path = f'/api/recipes/{recipe.id}/favorite/'
+
+    response = user_client.post(path)
+    assert response.status_code == 201
+    assert response.json()['id'] == recipe.id
+    assert user_client.post(path).status_code == 400
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 1
+
+    assert user_client.delete(path).status_code == 204
+    assert user_client.delete(path).status_code == 400
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 0
+    assert not Favorite.objects.exists()
+
+
+def test_subscribe_toggle_updates_counter_and_feed(
+    returning, user, user_client, author, make_recipes
+):
+    make_recipes(author, 2)
+    path = f'/api/users/{author.id}/subscribe/'
+
+    assert user_client.post(path).status_code == 201
+    assert user_client.post(path).status_code == 400
+    assert User.objects.get(pk=author.pk).followers_count == 1
+    assert FeedEntry.objects.filter(user=user).count() == 2
+
+    assert user_client.delete(path).status_code == 204
+    assert user_client.delete(path).status_code == 400
+    assert User.objects.get(pk=author.pk).followers_count == 0
+    assert not FeedEntry.objects.filter(user=user).exists()
+
+
+def test_feed_merges_fanout_and_popular_authors(
+    settings, user, user_client, author, make_recipes
+):
+    settings.FEED_FANOUT_MAX_FOLLOWERS = 1
+    popular, fan = (
+        User.objects.create(username=name, email=f'{name}@example.com')
+        for name in ('popular', 'fan')
+    )
+    Follow.objects.create(user=user, following=author)
+    Follow.objects.create(user=user, following=popular)
+    Follow.objects.create(user=fan, following=popular)
+    recipes = [
+        *make_recipes(author, 3), *make_recipes(popular, 3),
+        *make_recipes(author, 1)
+    ]
+    make_recipes(fan, 2)
+    assert set(FeedEntry.objects.filter(user=user).values_list(
+        'recipe__author', flat=True
+    )) == {author.id}
+
+    ids, url = [], '/api/recipes/feed/?limit=2'
+    while url:
+        data = user_client.get(url).json()
+        ids.extend(recipe['id'] for recipe in data['results'])
+        url = data['next']
+    assert ids == [
+        recipe.id for recipe in sorted(
+            recipes, key=lambda recipe: (recipe.pub_date, recipe.id),
+            reverse=True
+        )
+    ]
+
+
+def test_bulk_favorite_remove_reports_status_per_id(
+    returning, user, user_client, author, make_recipes
+):
+    linked, unlinked = make_recipes(author, 2)
+    Favorite.objects.create(user=user, recipe=linked)
+    missing = unlinked.id + 1000
+
+    response = user_client.delete(
+        '/api/recipes/favorite/',
+        {'ids': [linked.id, unlinked.id, missing]}, format='json'
+    )
+
+    assert response.status_code == 200
+    assert response.json()['results'] == [
+        {'id': linked.id, 'status': 'deleted'},
+        {'id': unlinked.id, 'status': 'absent'},
+        {'id': missing, 'status': 'not_found'},
+    ]
+    assert not Favorite.objects.exists()
+
+
+def test_favorite_missing_recipe_is_not_found(user_client):
+    recipe_id = 10**6
+    response = user_client.post(f'/api/recipes/{recipe_id}/favorite/')
+    assert response.status_code == 404
+    assert not Favorite.objects.exists()
@@ -0,0 +1,61 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes import counters
+from recipes.models import Recipe
+from users.models import Follow, User
+
+FOLLOWED_AUTHORS = 1000
+
+
+@pytest.fixture
+def followed_authors(user):
+    User.objects.bulk_create(
+        User(username=f'author-{number}',
+             email=f'author-{number}@example.com',
+             first_name='Автор', last_name=str(number), password='!')
+        for number in range(FOLLOWED_AUTHORS)
+    )
+    authors = list(User.objects.filter(username__startswith='author-'))
+    Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'Рецепт {number}', text='Текст',
+               cooking_time=10)
+        for author in authors
+        for number in range(3)
+    )
+    Follow.objects.bulk_create(
+        Follow(user=user, following=author) for author in authors
+    )
+    # bulk_create не обновляет счётчики.
+    for counter in counters.COUNTERS:
+        counters.reconcile(counter)
+    return authors
+
+
+@pytest.mark.parametrize('params', [
+    '', '&recipes_limit=2', '&cursor=', '&cursor=&recipes_limit=2',
+])
+def test_subscriptions_queries_do_not_grow_with_followed_authors(
+    params, user_client, followed_authors, django_assert_num_queries
+):
+    with CaptureQueriesContext(connection) as small_page:
+        response = user_client.get(
+            f'/api/users/subscriptions/?limit=1{params}'
+        )
+    assert len(response.json()['results']) == 1
+    assert len(small_page) <= 3
+
+    with django_assert_num_queries(len(small_page)):
+        response = user_client.get(
+            f'/api/users/subscriptions/?limit=20{params}'
+        )
+    data = response.json()
+    if 'cursor' not in params:
+        assert data['count'] == FOLLOWED_AUTHORS
+    assert len(data['results']) == 20
+    expected_recipes = 2 if 'recipes_limit' in params else 3
+    for author in data['results']:
+        assert author['is_subscribed']
+        assert author['recipes_count'] == 3
+        assert len(author['recipes']) == expected_recipes
@@ -44,6 +44,16 @@ class User(AbstractUser):
         choices=ROLE_CHOICES,
         default='user'
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False
+    )
 
     objects = UserManager()
 
@@ -1,3 +1,5 @@
+const MAX_DOWNLOAD_ATTEMPTS = 10
+
 class Api {
   constructor (url, headers) {
     this._url = url
@@ -385,18 +387,31 @@ class Api {
     ).then(this.checkResponse)
   }
 
-  downloadFile () {
+  downloadFile (attempt = 0) {
     const token = localStorage.getItem('token')
+    const headers = {
+      ...this._headers,
+      'authorization': `Token ${token}`
+    }
+    // after MAX_DOWNLOAD_ATTEMPTS responses with 202 ask for the file
+    // synchronously instead of waiting for the background job
+    if (attempt < MAX_DOWNLOAD_ATTEMPTS) {
+      headers['prefer'] = 'respond-async'
+    }
     return fetch(
       `/api/recipes/download_shopping_cart/`,
       {
         method: 'GET',
-        headers: {
-          ...this._headers,
-          'authorization': `Token ${token}`
-        }
+        headers
+      }
+    ).then(res => {
+      if (res.status === 202) {
+        const delay = Number(res.headers.get('retry-after') || 1) * 1000
+        return new Promise(resolve => setTimeout(resolve, delay))
+          .then(() => this.downloadFile(attempt + 1))
       }
-    ).then(this.checkFileDownloadResponse)
+      return this.checkFileDownloadResponse(res)
+    })
   }
 }
 